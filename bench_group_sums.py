@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the weight reductions on synthetic PUMS files.
+
+Sums the 81 WGTP/WGTP1..80 columns of a synth_pums scale by group, two ways:
+    puma    one group per PUMA, as the original script's loop of one
+            filtered pums_est per PUMA
+    cell    one group per (ST, PUMA) x cohort flag cell, as cube_engine
+and times each method that applies:
+    pums_est loop       filter and pums_est per group (puma only)
+    pandas groupby      grouped sum of the weight frame
+    numpy               group_sums without numba
+    compiled xN         group_sums with numba on N threads (if installed)
+Every method's sums are checked against the pandas ones.
+
+Usage:
+    python bench_group_sums.py --scale newengland --threads 1 4
+"""
+
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cohort_spec import HOMESHARE_COHORTS, HOUSING_DEMAND_COHORTS, spec_thresholds
+from cube_engine import FLAG_COLS, GEO_COLS, tag_households
+from group_sums import COMPILED, group_sums
+from pums_load import hh_columns, load_hhpums
+from replicate_est import WGTP_COLS, pums_est
+from synth_pums import write_synth
+
+
+def best_time(func, repeat = 3):
+    # Best-of-repeat seconds of func() and its last result
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def load_groups(hhfiles):
+    # Weight matrix and PUMA and cell group codes of every household
+    specs = [HOMESHARE_COHORTS, HOUSING_DEMAND_COHORTS]
+    hhpums = pd.concat([load_hhpums(f, usecols = hh_columns(specs, extra = ['ST'])) for f in hhfiles],
+                       ignore_index = True)
+    tags = tag_households(hhpums, cb_thresholds = spec_thresholds(specs, 'cb'),
+                          rb_thresholds = spec_thresholds(specs, 'rb'))
+    keys = [tags[col].values for col in GEO_COLS + FLAG_COLS if col in tags]
+    groups = {'puma': pd.Series(keys[0]).groupby(keys[:2], sort = True).ngroup().values,
+              'cell': pd.Series(keys[0]).groupby(keys, sort = True, dropna = False).ngroup().values}
+    return hhpums, np.ascontiguousarray(hhpums[WGTP_COLS].values), groups
+
+
+def bench(scale = 'state', factor = 1.0, threads = (1,), repeat = 3, datadir = None):
+    # {grouping: [(method, seconds, matches pandas)]} and the row count
+    datadir = datadir or os.path.join(tempfile.gettempdir(), 'pums_bench', '%s-%g' % (scale, factor))
+    (hhpums, wgts, groups) = load_groups(write_synth(datadir, scale, factor, overwrite = False))
+    frame = pd.DataFrame(wgts, columns = WGTP_COLS)
+
+    results = {}
+    for (grouping, codes) in groups.items():
+        ngroups = int(codes.max()) + 1
+        methods = []
+        if grouping == 'puma':
+            methods.append(('pums_est loop', lambda: np.array([[pums_est(hhpums[codes == g])[0]]
+                                                               for g in range(ngroups)])))
+        methods.append(('pandas groupby', lambda: frame.groupby(codes).sum().values))
+        methods.append(('numpy', lambda: group_sums(codes, wgts, ngroups, threads = 1, compiled = False)))
+        if COMPILED:
+            # Compile (or load the cached kernel) outside the timings
+            group_sums(codes[:10], wgts[:10], ngroups)
+            for n in threads:
+                methods.append(('compiled x%d' % n, lambda n = n: group_sums(codes, wgts, ngroups, threads = n)))
+
+        rows = []
+        expected = None
+        for (method, func) in methods:
+            (seconds, sums) = best_time(func, 1 if method == 'pums_est loop' else repeat)
+            if method == 'pandas groupby':
+                expected = sums
+            rows.append((method, seconds, sums))
+        results[grouping] = [(method, seconds, np.array_equal(sums, expected[:, :sums.shape[1]]))
+                             for (method, seconds, sums) in rows]
+    return results, len(wgts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark grouped replicate weight sums on synthetic files')
+    parser.add_argument('--scale', choices = ['state', 'newengland', 'national'], default = 'state')
+    parser.add_argument('--factor', type = float, default = 1.0, help = 'multiply synthetic record counts by this')
+    parser.add_argument('--threads', type = int, nargs = '*', default = [1, os.cpu_count() or 1],
+                        help = 'thread counts for the compiled kernel')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per method, best time kept')
+    parser.add_argument('--datadir', default = None, help = 'where to write the synthetic files')
+    args = parser.parse_args()
+
+    (results, nrows) = bench(args.scale, args.factor, sorted(set(args.threads)), args.repeat, args.datadir)
+    print('%s x%g: %d rows%s' % (args.scale, args.factor, nrows, '' if COMPILED else ' (numba not installed)'))
+    for (grouping, rows) in results.items():
+        print('  by %s' % grouping)
+        for (method, seconds, same) in rows:
+            print('    %-16s %8.3fs %12d rows/s%s' % (method, seconds, nrows/max(seconds, 1e-9),
+                                                       '' if same else '  SUMS DIFFER'))
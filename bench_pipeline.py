@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the estimation pipeline on synthetic PUMS files.
+
+Times each stage of a run over the files of a synth_pums scale:
+    load        column-projected csv read (pums_load)
+    classify    tagging, cell aggregation and cohort masks (cube_engine,
+                cohort_spec)
+    estimate    replicate cube and MoEs (puma_cube, cube_est)
+    write       long csv of the estimates
+and reports seconds, housing records per second and the process's peak RSS
+after the stage (a high-water mark, so it only grows across stages).
+
+Each run is appended to a JSON-lines history with the git revision. With
+--check, the run is compared with the last recorded run at the same scale
+and the exit status is 1 if any stage got slower by more than --tolerance.
+
+Usage:
+    python bench_pipeline.py --scale newengland --factor 0.5 --check
+"""
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from cohort_spec import HOMESHARE_COHORTS, HOMESHARE_NAME, TOTAL_COHORTS, TOTAL_NAME, compile_cohorts, spec_thresholds
+from cube_engine import cell_totals, cube_est, cube_frame, puma_cube, tag_households
+from multistate import merge_cells
+from profiling import peak_rss_mb
+from pums_load import hh_columns, load_hhpums
+from replicate_est import WGTP_COLS
+from synth_pums import write_synth
+
+STAGES = ['load', 'classify', 'estimate', 'write']
+
+
+def git_revision():
+    # Current commit of the source tree, or None outside a git checkout
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                             cwd = os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_pipeline(hhfiles, outfile, spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME):
+    # One timed pass over hhfiles; {stage: (seconds, peak RSS MB)} and the
+    # number of housing records
+    timings = {}
+    usecols = hh_columns([TOTAL_COHORTS, spec], extra = ['ST'])
+
+    start = time.perf_counter()
+    frames = [load_hhpums(f, usecols = usecols) for f in hhfiles]
+    nrows = sum(len(hhpums) for hhpums in frames)
+    timings['load'] = (time.perf_counter() - start, peak_rss_mb())
+
+    start = time.perf_counter()
+    cb_thresholds = spec_thresholds(spec, 'cb')
+    parts = [cell_totals(tag_households(hhpums, cb_thresholds = cb_thresholds), hhpums[WGTP_COLS])
+             for hhpums in frames]
+    (cells, cellwgts) = merge_cells(parts)
+    cohort_masks = compile_cohorts(cells, TOTAL_COHORTS, TOTAL_NAME)
+    cohort_masks.update(compile_cohorts(cells, spec, name))
+    timings['classify'] = (time.perf_counter() - start, peak_rss_mb())
+
+    start = time.perf_counter()
+    (geos, cube) = puma_cube(cells, cellwgts, np.column_stack(list(cohort_masks.values())),
+                             geo_cols = ('ST', 'PUMA'))
+    cube_est(cube)
+    timings['estimate'] = (time.perf_counter() - start, peak_rss_mb())
+
+    start = time.perf_counter()
+    cube_frame(geos, list(cohort_masks), cube).to_csv(outfile, index = False)
+    timings['write'] = (time.perf_counter() - start, peak_rss_mb())
+    return timings, nrows
+
+
+def bench(scale = 'state', factor = 1.0, repeat = 3, datadir = None):
+    # Best-of-repeat timings for a scale, as a history record
+    datadir = datadir or os.path.join(tempfile.gettempdir(), 'pums_bench', '%s-%g' % (scale, factor))
+    hhfiles = write_synth(datadir, scale, factor, overwrite = False)
+    outfile = os.path.join(datadir, 'estimates.csv')
+
+    best = {}
+    for _ in range(repeat):
+        (timings, nrows) = run_pipeline(hhfiles, outfile)
+        for stage in STAGES:
+            if stage not in best or timings[stage][0] < best[stage][0]:
+                best[stage] = timings[stage]
+
+    return {'revision': git_revision(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scale': scale,
+            'factor': factor,
+            'rows': nrows,
+            'stages': dict((stage, {'seconds': round(best[stage][0], 4),
+                                    'rows_per_sec': round(nrows/max(best[stage][0], 1e-9)),
+                                    'peak_rss_mb': best[stage][1]}) for stage in STAGES)}
+
+
+def regressions(record, history, tolerance = 0.2):
+    # Stages more than tolerance slower than the last run at the same scale
+    previous = [r for r in history if r['scale'] == record['scale'] and r['factor'] == record['factor']]
+    if not previous:
+        return []
+    last = previous[-1]
+    slower = []
+    for stage in STAGES:
+        (old, new) = (last['stages'][stage]['seconds'], record['stages'][stage]['seconds'])
+        if new > old*(1 + tolerance):
+            slower.append((stage, old, new, last['revision']))
+    return slower
+
+
+def read_history(historyfile):
+    if not os.path.exists(historyfile):
+        return []
+    with open(historyfile) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the PUMS estimation pipeline on synthetic files')
+    parser.add_argument('--scale', choices = ['state', 'newengland', 'national'], default = 'state')
+    parser.add_argument('--factor', type = float, default = 1.0, help = 'multiply synthetic record counts by this')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per stage, best time kept')
+    parser.add_argument('--datadir', default = None, help = 'where to write the synthetic files')
+    parser.add_argument('--history', default = 'bench_history.jsonl', help = 'JSON-lines file of past runs')
+    parser.add_argument('--check', action = 'store_true', help = 'exit 1 on a regression against the last run')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown fraction (default 0.2)')
+    args = parser.parse_args()
+
+    record = bench(args.scale, args.factor, args.repeat, args.datadir)
+    history = read_history(args.history)
+    print('%s x%g: %d rows, revision %s' % (record['scale'], record['factor'], record['rows'], record['revision']))
+    for stage in STAGES:
+        result = record['stages'][stage]
+        print('  %-9s %8.3fs %12d rows/s  peak RSS %s MB' % (stage, result['seconds'], result['rows_per_sec'],
+                                                             result['peak_rss_mb']))
+    slower = regressions(record, history, args.tolerance)
+    for (stage, old, new, revision) in slower:
+        print('  REGRESSION %s: %.3fs -> %.3fs (last run %s)' % (stage, old, new, revision))
+
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    if args.check and slower:
+        sys.exit(1)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Ad hoc cohort queries against an in-memory household table.
+
+The housing file (and person file, if given) is loaded, joined and tagged
+once into a compact table: the tag_households flags, the raw housing
+columns (N/A as NaN) and an (households x 81) int32 weight matrix. Queries
+are then answered from memory with replicate MoEs, and repeated queries
+come from an LRU cache. Every condition and cohort level is evaluated once
+into a packed bitset (see predicate_index), so a query is the AND of its
+predicates' bits and one masked reduction of the weights. A query is a JSON object:
+    where    column conditions in cohort_spec level syntax; a two-item
+             list whose first item is an operator is (op, value):
+                 {"owned": true, "NP": 1, "R65": ["==", "NP"],
+                  "BDSP": [">=", 3], "OCPIP": [">=", 40], "PUMA": [3304]}
+             cb and rb are coded at the specs' cut points (30, 50), so
+             other cuts are asked of the raw OCPIP and GRPIP
+    cohort   a named cohort of the specs (e.g. "hh1p65o_3r"), ANDed with where
+    by       column to break the estimate down by (e.g. "PUMA")
+    stat     "count" (default), "mean" or a quantile (0.5 for the median)
+    value    column for mean and quantiles
+Columns are listed by GET /columns (or "columns" at the prompt).
+
+Usage:
+    python cohort_query.py psam_h25.csv --pfile psam_p25.csv --port 8765
+    curl 'localhost:8765/query?q={"where":{"owned":true,"NP":1,"R65":["==","NP"],"PUMA":3304}}'
+    python cohort_query.py psam_h25.csv --prompt
+"""
+
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from cohort_spec import (DEMAND_COHORTS, DEMAND_NAME, HOMESHARE_COHORTS, HOMESHARE_NAME, HOUSEHOLDER_COHORTS,
+                         HOUSEHOLDER_NAME, HOUSING_DEMAND_COHORTS, OPS, cohort_names, spec_thresholds)
+from cube_engine import tag_households
+from group_sums import group_sums
+from person_join import householder_features, join_householder
+from predicate_index import all_bits, cohort_bits, level_bits, masked_totals, new_index, unpack
+from pums_load import hh_columns, load_hhpums_cached
+from replicate_est import WGTP_COLS, mean_est, rep_est, rep_quantiles
+
+# Raw housing columns loaded beyond what the specs need
+QUERY_COLUMNS = ['ST', 'TEN', 'NP', 'BDSP', 'OCPIP', 'GRPIP', 'HINCP']
+
+# Threshold-coded flags (highest configured cut point met, -1 if none) and
+# the raw column each is coded from; where conditions on a flag may only
+# use its cut points
+CODED_COLUMNS = {'cb': 'OCPIP', 'rb': 'GRPIP'}
+
+# Estimate fields, in rep_est order
+EST_FIELDS = ['est', 'moe', 'moep', 'upper', 'lower']
+
+
+def load_query_table(hhfile, pfile = None, specs = None, columns = QUERY_COLUMNS, cache_dir = None,
+                     cache_size = 1024):
+    # Query state: the tagged household table, its weight matrix, the
+    # cohort specs (default: supply and demand, as in the pipeline) and an
+    # empty result cache
+    if specs is None:
+        specs = [(HOMESHARE_COHORTS, HOMESHARE_NAME)]
+        if pfile:
+            specs.append((HOUSEHOLDER_COHORTS, HOUSEHOLDER_NAME))
+        specs.append((DEMAND_COHORTS if pfile else HOUSING_DEMAND_COHORTS, DEMAND_NAME))
+    spec_list = [spec for (spec, _) in specs]
+    hhpums = load_hhpums_cached(hhfile, usecols = hh_columns(spec_list, extra = columns), cache_dir = cache_dir)
+    if pfile:
+        hhpums = join_householder(hhpums, householder_features(pfile))
+
+    # Flags from the same tagging as the pipeline, then the raw columns as
+    # they are (so NP 4 and OCPIP 40 can be asked for)
+    cuts = {col: spec_thresholds(spec_list, col) for col in CODED_COLUMNS}
+    table = tag_households(hhpums, cb_thresholds = cuts['cb'], age_thresholds = spec_thresholds(spec_list, 'HHAGE'),
+                           rb_thresholds = cuts['rb'])
+    for col in hhpums:
+        if col in WGTP_COLS or col == 'SERIALNO':
+            continue
+        if col in ('ST', 'PUMA'):
+            table[col] = np.asarray(hhpums[col]).astype(np.int64)
+        elif hhpums[col].dtype == bool:
+            table[col] = hhpums[col].values
+        else:
+            table[col] = hhpums[col].astype(np.float64).values
+    table = table.reset_index(drop = True)
+    return {'table': table,
+            'index': new_index(table),
+            'wgts': np.ascontiguousarray(hhpums[WGTP_COLS].values, dtype = np.int32),
+            'specs': specs,
+            'cuts': cuts,
+            'cache': OrderedDict(),
+            'cache_size': cache_size,
+            'lock': threading.Lock()}
+
+
+def parse_level(where):
+    # cohort_spec level from JSON conditions: [op, value] -> (op, value)
+    level = {}
+    for (col, cond) in where.items():
+        if isinstance(cond, list) and len(cond) == 2 and cond[0] in OPS:
+            cond = tuple(cond)
+        level[col] = cond
+    return level
+
+
+def query_mask(state, query):
+    # Households in a query's where and cohort
+    table = state['table']
+    for col in list(query.get('where', {})) + [query.get('by'), query.get('value')]:
+        if col is not None and col not in table:
+            raise ValueError('unknown column %r' % col)
+    index = state['index']
+    bits = all_bits(index)
+    for (col, cond) in parse_level(query.get('where', {})).items():
+        if col in CODED_COLUMNS:
+            _check_cuts(state, col, cond)
+        bits &= level_bits(index, {col: cond})
+    cohort = query.get('cohort')
+    if cohort is not None:
+        specs = [(spec, name) for (spec, name) in state['specs'] if cohort in cohort_names(spec, name)]
+        if not specs:
+            raise ValueError('unknown cohort %r' % cohort)
+        bits &= cohort_bits(index, specs[0][0], specs[0][1], cohort)
+    return unpack(index, bits)
+
+
+def _check_cuts(state, col, cond):
+    # A condition on a threshold-coded flag must compare with its cut points
+    values = [cond[1]] if isinstance(cond, tuple) else cond if isinstance(cond, list) else [cond]
+    cuts = state['cuts'][col]
+    if any(value not in cuts + [-1] for value in values):
+        raise ValueError('%s holds only the cut points %s (-1 below them); use %s for other values'
+                         % (col, ', '.join('%g' % cut for cut in cuts), CODED_COLUMNS[col]))
+
+
+def estimate(state, query):
+    # Uncached query result: estimate fields, or a list of them per by value
+    table = state['table']
+    mask = query_mask(state, query)
+    stat = query.get('stat', 'count')
+    by = query.get('by')
+    if by is None and stat == 'count':
+        return _fields(rep_est(masked_totals(state['wgts'], mask)), 0)
+    rows = np.flatnonzero(mask)
+    if by is None:
+        (codes, groups) = (np.zeros(len(rows), dtype = np.intp), [None])
+    else:
+        # Households with by N/A are left out
+        (codes, groups) = pd.factorize(table[by].values[rows], sort = True)
+        (rows, codes) = (rows[codes >= 0], codes[codes >= 0])
+    wgts = state['wgts'][rows]
+
+    if stat == 'count':
+        est = rep_est(group_sums(codes, wgts, len(groups)))
+    else:
+        values = table[query['value']].values[rows].astype(np.float64)
+        groupmasks = codes[:, None] == np.arange(len(groups))
+        if stat == 'mean':
+            est = mean_est(values, wgts, groupmasks)
+        else:
+            est = rep_est(rep_quantiles(values, wgts, groupmasks, float(stat))[0])
+
+    results = [_fields(est, k) for k in range(len(groups))]
+    if by is None:
+        return results[0]
+    for (group, result) in zip(groups, results):
+        result[by] = group.item() if hasattr(group, 'item') else group
+    return results
+
+
+def _fields(est, k):
+    # JSON-ready estimate fields of row k of rep_est output
+    return dict((field, None if np.isnan(x[k]) else float(x[k])) for (field, x) in zip(EST_FIELDS, est))
+
+
+def run_query(state, query):
+    # Query result with its time in ms and whether it came from the cache
+    start = time.perf_counter()
+    key = json.dumps(query, sort_keys = True)
+    with state['lock']:
+        result = state['cache'].get(key)
+        if result is not None:
+            state['cache'].move_to_end(key)
+    cached = result is not None
+    if not cached:
+        result = estimate(state, query)
+        with state['lock']:
+            state['cache'][key] = result
+            if len(state['cache']) > state['cache_size']:
+                state['cache'].popitem(last = False)
+    return {'result': result, 'cached': cached, 'ms': round(1000*(time.perf_counter() - start), 3)}
+
+
+def columns(state):
+    # Queryable columns and named cohorts
+    return {'columns': list(state['table'].columns),
+            'cohorts': [c for (spec, name) in state['specs'] for c in cohort_names(spec, name)]}
+
+
+def serve(state, host = '127.0.0.1', port = 8765):
+    # HTTP service: GET /query?q=<json>, POST /query with a JSON body, GET /columns
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def answer(self, text):
+            try:
+                self.reply(200, run_query(state, json.loads(text)))
+            except (ValueError, KeyError, TypeError) as err:
+                self.reply(400, {'error': str(err)})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/columns':
+                self.reply(200, columns(state))
+            elif url.path == '/query' and 'q' in parse_qs(url.query):
+                self.answer(parse_qs(url.query)['q'][0])
+            else:
+                self.reply(404, {'error': 'use /query?q=<json> or /columns'})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/query':
+                self.reply(404, {'error': 'use /query'})
+                return
+            self.answer(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print('serving queries on http://%s:%d/query' % (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def prompt(state, infile = sys.stdin, outfile = sys.stdout):
+    # One JSON query per line, one JSON answer per line
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            answer = columns(state) if line == 'columns' else run_query(state, json.loads(line))
+        except (ValueError, KeyError, TypeError) as err:
+            answer = {'error': str(err)}
+        outfile.write(json.dumps(answer) + '\n')
+        outfile.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Ad hoc PUMS cohort estimates from an in-memory table')
+    parser.add_argument('hhfile', help = 'PUMS housing csv')
+    parser.add_argument('--pfile', default = None, help = 'PUMS person csv, for householder columns')
+    parser.add_argument('--columns', nargs = '*', default = QUERY_COLUMNS, help = 'extra raw housing columns')
+    parser.add_argument('--cache-dir', default = None, help = 'parsed-input cache (see pums_load)')
+    parser.add_argument('--port', type = int, default = 8765, help = 'localhost port (default 8765)')
+    parser.add_argument('--prompt', action = 'store_true', help = 'read queries from stdin instead of serving HTTP')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = load_query_table(args.hhfile, args.pfile, columns = args.columns, cache_dir = args.cache_dir)
+    print('loaded %d households in %.1fs' % (len(state['table']), time.perf_counter() - start), file = sys.stderr)
+    if args.prompt:
+        prompt(state)
+    else:
+        serve(state, port = args.port)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative cohort specification for homeshare supply and demand estimates.
+
+A spec maps each dimension to its levels, and each level to the column
+conditions a household (or cell) must meet:
+    scalar            column == value
+    list              column in list
+    (op, value)       column <op> value, op in ==, !=, >=, >, <=, <
+                      (a string value names another column)
+    list of dicts     any of the condition sets (union of levels)
+Cohorts are the cross product of levels. Each level mask is built once and
+cohorts are combined from them with bitwise AND, so a new threshold costs
+one mask rather than a new filtered copy per combination.
+"""
+
+
+import itertools
+import operator
+
+import numpy as np
+import pandas as pd
+
+OPS = {'==': operator.eq, '!=': operator.ne,
+       '>=': operator.ge, '>': operator.gt,
+       '<=': operator.le, '<': operator.lt}
+
+# Totals: all housing units (vacant included; group quarters carry no
+# WGTP) and occupied housing units, the base of cohort shares
+TOTAL_COHORTS = {'units': {'all': {},
+                           'occ': {'occupied': True}}}
+TOTAL_NAME = 'hhs_{units}'
+
+# Owned one person and two person couple households
+ONEP = {'owned': True, 'NP': 1}
+TWOP = {'owned': True, 'NP': 2, 'couple': True}
+
+# Older owners with spare bedrooms. All household members are 60+/65+
+# (R60/R65 count persons up to 2, so R60 == NP for one or two persons).
+# 'cb' is the OCPIP (owner costs as % of income) threshold met.
+HOMESHARE_COHORTS = {'hh': {'1p': ONEP,
+                            '2p': TWOP,
+                            '12p': [ONEP, TWOP]},
+                     'age': {'60': {'R60': ('==', 'NP')},
+                             '65': {'R65': ('==', 'NP')}},
+                     'br': {'2': {'BDSP': ('>=', 2)},
+                            '3': {'BDSP': ('>=', 3)}},
+                     'cb': {'': {},
+                            '_cb30': {'cb': ('>=', 30.0)},
+                            '_cb50': {'cb': ('>=', 50.0)}}}
+HOMESHARE_NAME = 'hh{hh}{age}o_{br}r{cb}'
+
+# The same cohorts by householder age (HHAGE, from the person file) instead
+# of the presence of 60+/65+ persons, split by whether the householder is
+# employed and whether they have a disability. HHAGE is coded as the
+# highest age threshold met.
+HOUSEHOLDER_COHORTS = {'hh': HOMESHARE_COHORTS['hh'],
+                       'age': {'60': {'HHAGE': ('>=', 60)},
+                               '65': {'HHAGE': ('>=', 65)}},
+                       'br': HOMESHARE_COHORTS['br'],
+                       'cb': HOMESHARE_COHORTS['cb'],
+                       'emp': {'': {},
+                               '_emp': {'HHEMP': True},
+                               '_nemp': {'HHEMP': False}},
+                       'dis': {'': {},
+                               '_dis': {'HHDIS': True},
+                               '_ndis': {'HHDIS': False}}}
+HOUSEHOLDER_NAME = 'hh{hh}{age}h_{br}r{cb}{emp}{dis}'
+
+# The homeshare cohorts by area median income band instead of cost burden
+# ('ami' is the lowest of 30/50/80% AMI the income is at or under, see
+# income_band)
+INCOME_COHORTS = {'hh': HOMESHARE_COHORTS['hh'],
+                  'age': HOMESHARE_COHORTS['age'],
+                  'br': HOMESHARE_COHORTS['br'],
+                  'ami': {'_ami30': {'ami': ('<=', 30)},
+                          '_ami50': {'ami': ('<=', 50)},
+                          '_ami80': {'ami': ('<=', 80)}}}
+INCOME_NAME = 'hh{hh}{age}o_{br}r{ami}'
+
+# Homeshare demand: renter households (TEN 3), all and one person, by
+# rent burden. 'rb' is the GRPIP (gross rent as % of income) threshold met.
+RENTER = {'renter': True}
+HOUSING_DEMAND_COHORTS = {'who': {'rent': RENTER,
+                                  'rent1p': {'renter': True, 'NP': 1}},
+                          'rb': {'': {},
+                                 '_rb30': {'rb': ('>=', 30.0)},
+                                 '_rb50': {'rb': ('>=', 50.0)}}}
+DEMAND_NAME = 'dm_{who}{rb}'
+
+# With the person file, also young-adult (householder under 35), student
+# (householder in college or graduate school) and single employed renters
+DEMAND_COHORTS = {'who': dict(HOUSING_DEMAND_COHORTS['who'],
+                              ya = {'renter': True, 'HHAGE': ('<', 35)},
+                              stu = {'renter': True, 'HHSCH': True},
+                              wkr1p = {'renter': True, 'NP': 1, 'HHEMP': True}),
+                  'rb': HOUSING_DEMAND_COHORTS['rb']}
+
+
+def condition_mask(data, col, cond):
+    # Boolean mask for a single column condition
+    values = np.asarray(data[col])
+    if isinstance(cond, tuple):
+        (op, value) = cond
+        if isinstance(value, str):
+            value = np.asarray(data[value])
+        return OPS[op](values, value)
+    if isinstance(cond, list):
+        return np.isin(values, cond)
+    return values == cond
+
+
+def level_mask(data, level):
+    # AND of a level's conditions, or OR across a list of condition sets
+    if isinstance(level, list):
+        return np.logical_or.reduce([level_mask(data, lvl) for lvl in level])
+    mask = np.ones(len(data), dtype = bool)
+    for (col, cond) in level.items():
+        mask &= condition_mask(data, col, cond)
+    return mask
+
+
+def _spec_levels(spec):
+    # Every level of a spec, or of a list of specs
+    specs = spec if isinstance(spec, list) else [spec]
+    return [level for spec in specs for levels in spec.values() for level in levels.values()]
+
+
+def spec_thresholds(spec, col):
+    # Every threshold value the spec (or list of specs) applies to col (e.g.
+    # cost-burden cuts)
+    found = set()
+    def collect(level):
+        if isinstance(level, list):
+            for lvl in level:
+                collect(lvl)
+            return
+        cond = level.get(col)
+        if isinstance(cond, tuple):
+            found.add(cond[1])
+        elif isinstance(cond, list):
+            found.update(cond)
+        elif cond is not None:
+            found.add(cond)
+    for level in _spec_levels(spec):
+        collect(level)
+    return sorted(found)
+
+
+def spec_columns(spec):
+    # Every column a spec's (or list of specs') conditions refer to
+    found = set()
+    def collect(level):
+        if isinstance(level, list):
+            for lvl in level:
+                collect(lvl)
+            return
+        for (col, cond) in level.items():
+            found.add(col)
+            if isinstance(cond, tuple) and isinstance(cond[1], str):
+                found.add(cond[1])
+    for level in _spec_levels(spec):
+        collect(level)
+    return sorted(found)
+
+
+def drop_dimension(spec, name, dim):
+    # Spec and name pattern without one dimension (e.g. to sweep it instead)
+    spec = {d: levels for (d, levels) in spec.items() if d != dim}
+    return spec, name.replace('{' + dim + '}', '')
+
+
+def cohort_names(spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME):
+    # Names compile_cohorts gives, in the same order, without any data
+    return [name.format(**dict(zip(spec, combo)))
+            for combo in itertools.product(*[list(levels) for levels in spec.values()])]
+
+
+def cohort_key(spec, name, cohort):
+    # {dimension: level} of a named cohort, None if spec has no such cohort
+    for combo in itertools.product(*[list(levels) for levels in spec.values()]):
+        key = dict(zip(spec, combo))
+        if name.format(**key) == cohort:
+            return key
+    return None
+
+
+def compile_cohorts(data, spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME, only = None):
+    # {cohort name: boolean mask} for every combination of levels, or for
+    # the names in only; each level's mask is computed once, if used
+    level_masks = {}
+    cohorts = {}
+    for combo in itertools.product(*[list(levels) for levels in spec.values()]):
+        key = dict(zip(spec, combo))
+        cohort = name.format(**key)
+        if only is not None and cohort not in only:
+            continue
+        masks = []
+        for (dim, lvl) in key.items():
+            if (dim, lvl) not in level_masks:
+                level_masks[(dim, lvl)] = level_mask(data, spec[dim][lvl])
+            masks.append(level_masks[(dim, lvl)])
+        cohorts[cohort] = np.logical_and.reduce(masks)
+    return cohorts
+
+
+def cohort_levels(spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME):
+    # One row per cohort (compile_cohorts order) with the level of each
+    # dimension, e.g. hh1p60o_2r_cb30 -> hh 1p, age 60, br 2, cb cb30; the
+    # empty level of a dimension is N/A
+    rows = []
+    for combo in itertools.product(*[list(levels) for levels in spec.values()]):
+        row = {'cohort': name.format(**dict(zip(spec, combo)))}
+        row.update((dim, lvl.lstrip('_') or None) for (dim, lvl) in zip(spec, combo))
+        rows.append(row)
+    return pd.DataFrame(rows, columns = ['cohort'] + list(spec))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of replicate cubes.
+
+Each entry holds the WGTP and WGTP1..80 sums for every (geography, cohort)
+cell of a run, keyed by the input files' fingerprints (size, mtime, content
+hash), the cohort spec and the geography columns. Reruns, new output tables
+and derived ratios are served from the cache without reloading PUMS. The
+cache is bounded by total size, evicting the least recently used entries.
+"""
+
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from pums_load import source_fingerprint
+
+# Bump when the meaning of cached sums changes (tagging or cohort semantics)
+CACHE_VERSION = 3
+
+# Default size bound for a cache directory
+CACHE_MAX_BYTES = 1 << 30
+
+
+def cube_key(hhfiles, spec, name, geo_cols = ('PUMA',), cache_dir = None):
+    # Cache key for a run over hhfiles with a cohort spec
+    sources = [source_fingerprint(f, cache_dir) for f in hhfiles]
+    keyparts = repr((CACHE_VERSION, [(s['size'], s['sha256']) for s in sources],
+                     spec, name, list(geo_cols)))
+    return hashlib.sha256(keyparts.encode('utf-8')).hexdigest()[:32]
+
+
+def derived_key(key, *parts):
+    # Cache key for another cube of the same run (e.g. a value statistic)
+    return hashlib.sha256(repr((key,) + parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _read_index(cache_dir):
+    indexfile = os.path.join(cache_dir, 'cubes.json')
+    if not os.path.exists(indexfile):
+        return {}
+    with open(indexfile) as f:
+        return json.load(f)
+
+
+def _write_index(cache_dir, index):
+    indexfile = os.path.join(cache_dir, 'cubes.json')
+    with open(indexfile + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(indexfile + '.tmp', indexfile)
+
+
+def load_cube(cache_dir, key):
+    # (geos, cohorts, cube) for key, or None on a miss
+    index = _read_index(cache_dir)
+    entry = index.get(key)
+    if entry is None:
+        return None
+    cubefile = os.path.join(cache_dir, entry['file'])
+    if not os.path.exists(cubefile):
+        del index[key]
+        _write_index(cache_dir, index)
+        return None
+    with np.load(cubefile, allow_pickle = False) as data:
+        geo_cols = [str(col) for col in data['geo_cols']]
+        if len(geo_cols) == 1:
+            geos = pd.Index(data['geo_' + geo_cols[0]], name = geo_cols[0])
+        else:
+            geos = pd.MultiIndex.from_arrays([data['geo_' + col] for col in geo_cols], names = geo_cols)
+        cohorts = [str(c) for c in data['cohorts']]
+        cube = data['cube']
+    entry['atime'] = time.time()
+    _write_index(cache_dir, index)
+    return geos, cohorts, cube
+
+
+def save_cube(cache_dir, key, geos, cohorts, cube, max_bytes = CACHE_MAX_BYTES):
+    # Store a cube under key, then evict least recently used entries until
+    # the cache fits in max_bytes
+    os.makedirs(cache_dir, exist_ok = True)
+    geo = geos.to_frame(index = False)
+    arrays = {'geo_' + col: geo[col].values for col in geo.columns}
+    cubefile = 'cube-' + key + '.npz'
+    np.savez(os.path.join(cache_dir, cubefile + '.tmp.npz'), geo_cols = np.array(list(geo.columns)),
+             cohorts = np.array(list(cohorts)), cube = np.asarray(cube), **arrays)
+    os.replace(os.path.join(cache_dir, cubefile + '.tmp.npz'), os.path.join(cache_dir, cubefile))
+
+    index = _read_index(cache_dir)
+    index[key] = {'file': cubefile, 'size': os.path.getsize(os.path.join(cache_dir, cubefile)),
+                  'atime': time.time()}
+    total = sum(entry['size'] for entry in index.values())
+    for old in sorted(index, key = lambda k: index[k]['atime']):
+        if total <= max_bytes or old == key:
+            continue
+        total -= index[old]['size']
+        oldfile = os.path.join(cache_dir, index.pop(old)['file'])
+        if os.path.exists(oldfile):
+            os.remove(oldfile)
+    _write_index(cache_dir, index)
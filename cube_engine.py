@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass estimation engine for the PUMA x cohort cube.
+
+Each household row is tagged once with compact cohort flags (occupancy,
+tenure, household size, couple, bedrooms, 60+/65+ presence, owner
+cost-burden and renter rent-burden levels, AMI band). Supply (older owners) and demand (renters)
+cohorts are masks over the same cells, so both come from one scan. The
+rows are then collapsed with a single grouped aggregation into PUMA x flag
+cells holding the WGTP and WGTP1..80 sums. Every cohort is a boolean mask
+over these cells, so adding cohorts or PUMAs never rescans household rows.
+Cell sums are additive, so files larger than memory can be aggregated chunk
+by chunk (cell_totals_chunked) with MoEs computed only at the end. Means
+and quantiles of a housing value (stat_cube) use the same cells with the
+value carried as one more key. Differences between geographies
+(pairwise_est) take their MoEs from the replicate differences, so the
+covariance of two PUMAs' estimates from the same sample is accounted for.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from group_sums import COMPILED, group_sums
+from income_band import ami_band
+from replicate_est import WGTP_COLS, rep_est, rep_quantiles, rep_ratios
+
+# Geography columns carried into the cell keys when loaded (ST for
+# multi-state runs, since PUMA codes repeat across states)
+GEO_COLS = ['ST', 'PUMA']
+
+# Flag columns produced by tag_households, in cell key order
+FLAG_COLS = ['occupied', 'owned', 'renter', 'NP', 'couple', 'BDSP', 'R60', 'R65', 'cb', 'rb', 'ami',
+             'HHAGE', 'HHDIS', 'HHEMP', 'HHSCH']
+
+# Raw PUMS housing columns each flag is derived from
+TAG_SOURCES = {'occupied': ['TYPE', 'NP'],
+               'owned': ['TYPE', 'TEN'],
+               'renter': ['TYPE', 'TEN'],
+               'NP': ['NP'],
+               'couple': ['PARTNER', 'HHT', 'SSMC'],
+               'BDSP': ['BDSP'],
+               'R60': ['R60'],
+               'R65': ['R65'],
+               'cb': ['OCPIP'],
+               'rb': ['GRPIP'],
+               'ami': ['ST', 'PUMA', 'NP', 'HINCP', 'ADJINC'],
+               'HHAGE': ['HHAGE'],
+               'HHDIS': ['HHDIS'],
+               'HHEMP': ['HHEMP'],
+               'HHSCH': ['HHSCH']}
+
+# Householder flags joined from the person file rather than read from the
+# housing file (see person_join)
+PERSON_TAGS = ['HHAGE', 'HHDIS', 'HHEMP', 'HHSCH']
+
+
+def tag_households(hhpums, cb_thresholds = (30.0, 50.0), age_thresholds = (60, 65), rb_thresholds = (30.0, 50.0),
+                   keep = (), ami_limits = None):
+    # Compact per-household cohort flags, one row per input row. Flags whose
+    # source columns were not loaded are skipped, as is the AMI band without
+    # ami_limits (see income_band.ami_lookup). Raw columns in keep are
+    # carried as they are (float, NaN for N/A), e.g. a value to take medians of.
+    def num(col):
+        # float64 with NaN for N/A, for plain or nullable (UInt8) columns
+        return hhpums[col].astype(np.float64)
+    def code(col):
+        # int8 code with -1 for N/A (GQ/vacant)
+        return num(col).fillna(-1).astype(np.int8)
+    def has(tag):
+        return all(col in hhpums for col in TAG_SOURCES[tag])
+
+    tags = pd.DataFrame({col: np.asarray(hhpums[col]) for col in GEO_COLS if col in hhpums},
+                        index = hhpums.index)
+    # Occupied housing units: TYPE 1 with anyone living there (vacant units
+    # are NP 0)
+    if has('occupied'):
+        tags['occupied'] = (num('TYPE') == 1) & (num('NP') > 0)
+    # Owned (TEN 1 or 2) housing units (TYPE 1)
+    if has('owned'):
+        tags['owned'] = (num('TYPE') == 1) & num('TEN').isin([1, 2])
+    # Rented (TEN 3) housing units, not occupied without payment of rent
+    if has('renter'):
+        tags['renter'] = (num('TYPE') == 1) & (num('TEN') == 3)
+    # Household size, 3+ collapsed together
+    if has('NP'):
+        tags['NP'] = num('NP').clip(upper = 3).astype(np.int8)
+    # Couple households: married couple (HHT 1), unmarried partner (PARTNER
+    # 2-5) or same-sex married/unmarried couple (SSMC 1-2)
+    if has('couple'):
+        tags['couple'] = ((num('HHT') == 1.0) | num('PARTNER').isin([2.0, 3.0, 4.0, 5.0])
+                          | num('SSMC').isin([1.0, 2.0]))
+    # Bedrooms and 60+/65+ presence
+    for col in ['BDSP', 'R60', 'R65']:
+        if has(col):
+            tags[col] = code(col)
+    # Highest cost-burden threshold met (-1 if none, including N/A OCPIP)
+    if has('cb'):
+        tags['cb'] = _threshold_code(num('OCPIP').values, cb_thresholds)
+    # Highest rent-burden threshold met (GRPIP, gross rent as % of income)
+    if has('rb'):
+        tags['rb'] = _threshold_code(num('GRPIP').values, rb_thresholds)
+    # AMI band of HINCP in current dollars (ADJINC, 6 implied decimals)
+    if has('ami') and ami_limits is not None:
+        tags['ami'] = ami_band(ami_limits, np.asarray(hhpums['ST']), np.asarray(hhpums['PUMA']), num('NP').values,
+                               num('HINCP').values*num('ADJINC').values/1e6)
+    # Householder age band, disability, employment and college enrollment
+    # (person file)
+    if has('HHAGE'):
+        tags['HHAGE'] = _threshold_code(num('HHAGE').values, age_thresholds)
+    for col in ['HHDIS', 'HHEMP', 'HHSCH']:
+        if has(col):
+            tags[col] = hhpums[col].values.astype(bool)
+    for col in keep:
+        tags[col] = num(col).values
+    return tags
+
+
+def _threshold_code(values, thresholds):
+    # Highest threshold each value meets, -1 if none (or N/A). float64, so
+    # the codes compare equal to the thresholds they came from (33.3 is not
+    # exact in float32)
+    code = np.full(len(values), -1, dtype = np.float64)
+    for threshold in sorted(thresholds):
+        code[values >= threshold] = threshold
+    return code
+
+
+def _cell_frame(tags, wgts):
+    # (PUMA, flags) indexed frame of WGTP and WGTP1..80 sums; any other tag
+    # columns (tag_households keep) are keys after the flags
+    cols = [col for col in GEO_COLS + FLAG_COLS if col in tags]
+    cols += [col for col in tags if col not in cols]
+    keys = [tags[col].values for col in cols]
+    if not COMPILED:
+        wgts = pd.DataFrame(np.asarray(wgts), index = tags.index, columns = WGTP_COLS)
+        cells = wgts.groupby(keys, sort = True, dropna = False).sum()
+        cells.index.names = cols
+        return cells
+    # Cell codes from the grouping, weight sums from the compiled threaded
+    # pass (see group_sums), which is faster than the grouped sum
+    groups = pd.Series(np.zeros(len(tags), dtype = np.int8)).groupby(keys, sort = True, dropna = False)
+    index = groups.size().index
+    index.names = cols
+    return pd.DataFrame(group_sums(groups.ngroup().values, np.asarray(wgts), len(index)), index = index,
+                        columns = WGTP_COLS)
+
+
+def cell_totals(tags, wgts):
+    # One grouped aggregation: (geography, flags) cell keys and their (cells x 81) weight sums
+    cells = _cell_frame(tags, wgts)
+    return cells.index.to_frame(index = False), cells.values
+
+
+def cell_totals_chunked(chunks, cb_thresholds = (30.0, 50.0), age_thresholds = (60, 65),
+                        rb_thresholds = (30.0, 50.0), keep = (), ami_limits = None):
+    # Streaming cell_totals over an iterable of household row chunks (see
+    # pums_load.iter_hhpums). Each chunk is tagged and collapsed to cells,
+    # and the cell sums are accumulated, so memory is bounded by one chunk
+    # plus the cell table no matter how large the file is.
+    cells = None
+    for chunk in chunks:
+        part = _cell_frame(tag_households(chunk, cb_thresholds, age_thresholds, rb_thresholds, keep, ami_limits),
+                           chunk[WGTP_COLS])
+        if cells is None:
+            cells = part
+        else:
+            cells = pd.concat([cells, part]).groupby(level = part.index.names, sort = True, dropna = False).sum()
+    return cells.index.to_frame(index = False), cells.values
+
+
+def puma_cube(cell_keys, cell_wgts, cohort_masks, geo_cols = ('PUMA',)):
+    # (geographies x cohorts x 81) replicate totals from cell-level cohort masks
+    # cohort_masks: (cells x cohorts) boolean, rows aligned with cell_keys
+    # Returns the sorted geographies as an Index (MultiIndex for ('ST', 'PUMA'))
+    cohort_masks = np.asarray(cohort_masks, dtype = np.float64)
+    cell_wgts = np.asarray(cell_wgts, dtype = np.float64)
+    (codes, geos) = _geo_codes(cell_keys, geo_cols)
+    order = np.argsort(codes, kind = 'stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(geos) + 1))
+
+    cube = np.empty((len(geos), cohort_masks.shape[1], cell_wgts.shape[1]))
+    for k in range(len(geos)):
+        rows = order[bounds[k]:bounds[k + 1]]
+        cube[k] = cohort_masks[rows].T @ cell_wgts[rows]
+    return geos, cube
+
+
+def _geo_codes(cell_keys, geo_cols):
+    # Geography code of each cell and the sorted geographies
+    geo_cols = list(geo_cols)
+    if len(geo_cols) == 1:
+        geo_index = pd.Index(cell_keys[geo_cols[0]].values)
+    else:
+        geo_index = pd.MultiIndex.from_frame(cell_keys[geo_cols])
+    (codes, geos) = geo_index.factorize(sort = True)
+    geos.names = geo_cols
+    return codes, geos
+
+
+def stat_cube(cell_keys, cell_wgts, cohort_masks, col, stat = 0.5, geo_cols = ('PUMA',)):
+    # (geographies x cohorts x 81) replicate means (stat 'mean') or
+    # q-quantiles (stat q, 0.5 for the median) of value col, from cells
+    # keyed on it (see tag_households keep); cube_est gives their MoEs.
+    # Households with col N/A are left out.
+    values = cell_keys[col].values.astype(np.float64)
+    if stat == 'mean':
+        # Value total over weight total, both summed per cohort
+        known = np.asarray(cell_wgts, dtype = np.float64)*~np.isnan(values)[:, None]
+        (geos, value_totals) = puma_cube(cell_keys, known*np.nan_to_num(values)[:, None], cohort_masks, geo_cols)
+        (_, wgt_totals) = puma_cube(cell_keys, known, cohort_masks, geo_cols)
+        return geos, rep_ratios(value_totals, wgt_totals)
+    (codes, geos) = _geo_codes(cell_keys, geo_cols)
+    return geos, rep_quantiles(values, cell_wgts, cohort_masks, stat, codes)
+
+
+def regroup_cube(geos, cube, mapping):
+    # (regions x cohorts x 81) cube summing geographies into custom regions.
+    # mapping: dict or Series from geography (PUMA, or (ST, PUMA)) to region;
+    # geographies not in mapping are left out. MoEs from the summed replicate
+    # totals are exact, unlike a root-sum-of-squares of the PUMA MoEs.
+    region = pd.Series(mapping).reindex(geos).values
+    (codes, regions) = pd.factorize(region, sort = True)
+    keep = codes >= 0
+    region_cube = np.zeros((len(regions),) + np.shape(cube)[1:])
+    np.add.at(region_cube, codes[keep], np.asarray(cube)[keep])
+    return pd.Index(regions, name = 'region'), region_cube
+
+
+def cube_est(cube):
+    # Estimates for a (..., 81) replicate cube as (..., 5):
+    # [est, moe, moep, upper, lower]
+    cube = np.asarray(cube)
+    est = np.column_stack(rep_est(cube.reshape(-1, cube.shape[-1])))
+    return est.reshape(cube.shape[:-1] + (5,))
+
+
+def cube_frame(geos, cohorts, cube):
+    # Long table of a replicate cube: one row per geography x cohort with
+    # est, moe, moep, upper and lower
+    cohorts = list(cohorts)
+    geo = geos.to_frame(index = False)
+    frame = geo.loc[geo.index.repeat(len(cohorts))].reset_index(drop = True)
+    frame['cohort'] = np.tile(cohorts, len(geos))
+    est = cube_est(cube).reshape(-1, 5)
+    for (j, col) in enumerate(['est', 'moe', 'moep', 'upper', 'lower']):
+        frame[col] = est[:, j]
+    return frame
+
+
+def pairwise_est(cube):
+    # Differences between every pair of geographies of a (geos x cohorts x
+    # 81) cube, per cohort: (diff, moe, significant), each (geos x geos x
+    # cohorts), with diff[a, b] = est[a] - est[b]. The MoE is that of the 80
+    # replicate differences, expanded as
+    #     sum_r (d_ar - d_br)^2 = sum_r d_ar^2 + sum_r d_br^2 - 2 sum_r d_ar d_br
+    # (d the replicate deviations from the estimate) so every pair comes
+    # from one batched matrix product. Significant at 90% where |diff| > MoE.
+    cube = np.asarray(cube, dtype = np.float64)
+    est = cube[..., 0]
+    dev = cube[..., 1:] - cube[..., :1]
+    sumsq = np.square(dev).sum(axis = -1)
+    # cohorts x geos x geos
+    cross = np.matmul(dev.transpose(1, 0, 2), dev.transpose(1, 2, 0)).transpose(1, 2, 0)
+    var = (4/80)*(sumsq[:, None, :] + sumsq[None, :, :] - 2*cross)
+    moe = 1.645*np.sqrt(np.maximum(var, 0))
+    diff = est[:, None, :] - est[None, :, :]
+    return diff, moe, np.abs(diff) > moe
+
+
+def pairwise_independent(est, moe):
+    # Differences between every pair along the last axis of estimates from
+    # independent samples (e.g. vintages), with MoE sqrt(moe_a^2 + moe_b^2):
+    # (diff, moe, significant), each with the last axis expanded to pairs
+    est = np.asarray(est, dtype = np.float64)
+    moe = np.asarray(moe, dtype = np.float64)
+    diff = est[..., :, None] - est[..., None, :]
+    diffmoe = np.sqrt(np.square(moe)[..., :, None] + np.square(moe)[..., None, :])
+    return diff, diffmoe, np.abs(diff) > diffmoe
+
+
+def pairwise_frame(geos, cohorts, cube):
+    # Long table of pairwise_est: one row per cohort and ordered pair of
+    # different geographies, with both estimates, the difference, its MoE
+    # and significance
+    (diff, moe, significant) = pairwise_est(cube)
+    est = np.asarray(cube)[..., 0]
+    (a, b, c) = np.nonzero(np.broadcast_to(~np.eye(len(geos), dtype = bool)[:, :, None], diff.shape))
+    geo = geos.to_frame(index = False)
+    frame = pd.concat([geo.iloc[a].add_suffix('_a').reset_index(drop = True),
+                       geo.iloc[b].add_suffix('_b').reset_index(drop = True)], axis = 1)
+    frame.insert(0, 'cohort', np.asarray(list(cohorts))[c])
+    frame['est_a'] = est[a, c]
+    frame['est_b'] = est[b, c]
+    frame['difference'] = diff[a, b, c]
+    frame['moe'] = moe[a, b, c]
+    frame['significant'] = significant[a, b, c]
+    return frame
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Per-group sums of the (rows x 81) WGTP/WGTP1..80 weight matrix.
+
+group_sums(codes, wgts, ngroups) returns the (groups x 81) sums of the
+weight rows in each group (codes 0..ngroups-1, negative codes skipped), the
+reduction behind every cell total. Rows are read once, in order, each
+adding its 81 weights to its group's row of the result, so the weight
+matrix is streamed row-major instead of column by column. Integer weights
+(PUMS weights are) are accumulated as int64, so totals are exact.
+
+With numba installed the pass is a compiled loop that releases the GIL,
+and the rows are split into blocks summed on a thread pool, each into its
+own partial result. Without it, each block is summed with np.bincount over
+flattened (group, weight column) indices, which is slower but still a
+single pass; its float64 sums are exact for integer totals under 2^53.
+"""
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Whether group_sums runs compiled; the NumPy fallback is slower than a
+# pandas grouped sum, so callers that can use one do without numba
+COMPILED = numba is not None
+
+# Rows per thread below which fewer threads are used
+MIN_BLOCK_ROWS = 65536
+# Rows flattened at a time by the NumPy fallback
+FALLBACK_ROWS = 16384
+
+
+if numba is not None:
+    @numba.njit(nogil = True, cache = True)
+    def _sum_rows(codes, wgts, out):
+        # Compiled row-major pass: out[codes[i]] += wgts[i]
+        for i in range(wgts.shape[0]):
+            g = codes[i]
+            if g < 0:
+                continue
+            for j in range(wgts.shape[1]):
+                out[g, j] += wgts[i, j]
+
+
+def _sum_rows_numpy(codes, wgts, out):
+    # NumPy fallback of _sum_rows: one bincount per slice of rows over
+    # (group, column) indices, at least as many rows as groups at a time so
+    # the bincount result is not larger than its input
+    (ngroups, ncols) = out.shape
+    step = max(FALLBACK_ROWS, ngroups)
+    for start in range(0, len(codes), step):
+        part = codes[start:start + step]
+        keep = part >= 0
+        idx = (part[keep, None]*ncols + np.arange(ncols)).ravel()
+        sums = np.bincount(idx, weights = wgts[start:start + step][keep].ravel(), minlength = out.size)
+        out += sums.reshape(out.shape).astype(out.dtype)
+
+
+def group_sums(codes, wgts, ngroups, threads = None, compiled = None):
+    # (ngroups x columns) sums of the rows of wgts by group code; int64 for
+    # integer weights, float64 otherwise. threads: None for every core.
+    # compiled: None to use numba if installed, False to force NumPy.
+    codes = np.asarray(codes, dtype = np.intp)
+    wgts = np.ascontiguousarray(wgts)
+    dtype = np.int64 if np.issubdtype(wgts.dtype, np.integer) else np.float64
+    kernel = _sum_rows if COMPILED and compiled is not False else _sum_rows_numpy
+
+    threads = min(threads or os.cpu_count() or 1, max(1, len(codes)//MIN_BLOCK_ROWS))
+    bounds = np.linspace(0, len(codes), threads + 1).astype(np.intp)
+    def block(k):
+        out = np.zeros((ngroups, wgts.shape[1]), dtype = dtype)
+        kernel(codes[bounds[k]:bounds[k + 1]], wgts[bounds[k]:bounds[k + 1]], out)
+        return out
+    if threads == 1:
+        return block(0)
+    with ThreadPoolExecutor(threads) as pool:
+        return sum(pool.map(block, range(threads)))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Area median income (AMI) bands from HUD income limits.
+
+HUD publishes, for each area, the 30% (extremely low), 50% (very low) and
+80% (low) income limits by household size, 1 to 8 persons. A PUMA's limits
+are the afact-weighted mean of the limits of the areas it overlaps, taken
+from a PUMA -> county crosswalk (e.g. Geocorr). They are built once into a
+(3 bands x PUMAs x sizes) array, so banding households is a binary
+search for the PUMA and one fancy index, with no per-row apply.
+
+Household income is HINCP in current dollars (HINCP * ADJINC / 10^6;
+ADJINC is the income adjustment, ADJHSG the housing-cost one). Households
+are coded with the lowest band whose limit they are at or under:
+    30, 50, 80   at or under 30%, 50%, 80% AMI
+    100          above 80% AMI
+    101          N/A (vacant, GQ, or a PUMA without limits)
+so "at or under 50% AMI" is ami <= 50. Above 8 persons, each extra person
+adds 8% of the 4-person limit, as in HUD's method.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+AMI_BANDS = [30, 50, 80]
+# Limit column prefixes by band in the HUD Section 8 income limits file
+AMI_PREFIXES = {30: ['ELI_', 'l30_'], 50: ['l50_'], 80: ['l80_']}
+AMI_ABOVE = 100
+AMI_NA = 101
+
+
+def load_income_limits(limitsfile, area_col = 'fips2010', area_digits = 5):
+    # (areas index, areas x 3 bands x 8 sizes limits) from a HUD income
+    # limits csv. The area key is the first area_digits of area_col padded
+    # to 10 digits (5: county FIPS); areas with several rows (New England
+    # towns) get their median limits.
+    limits = pd.read_csv(limitsfile, dtype = {area_col: str})
+    cols = dict((col.lower(), col) for col in limits.columns)
+    bands = []
+    for band in AMI_BANDS:
+        prefix = [p for p in AMI_PREFIXES[band] if p.lower() + '1' in cols]
+        if not prefix:
+            raise ValueError('no %d%% AMI limit columns in %s' % (band, limitsfile))
+        bands.append([cols[prefix[0].lower() + str(k)] for k in range(1, 9)])
+    area = limits[area_col].str.strip().str.zfill(10).str[:area_digits]
+    table = limits[[col for band in bands for col in band]].astype(np.float64).groupby(area.values).median()
+    return table.index, table.values.reshape(-1, len(AMI_BANDS), 8)
+
+
+def load_area_crosswalk(xwalkfile, state_col = 'state', puma_col = 'puma12', area_col = 'county',
+                        factor_col = 'afact', skiprows = (1,)):
+    # PUMA -> area crosswalk as columns ST, PUMA, area and afact. Defaults
+    # follow the Geocorr csv layout (5 digit county FIPS, a second header
+    # row of labels).
+    xwalk = pd.read_csv(xwalkfile, skiprows = list(skiprows), dtype = str)
+    return pd.DataFrame({'ST': xwalk[state_col].astype(int),
+                         'PUMA': xwalk[puma_col].astype(int),
+                         'area': xwalk[area_col].str.strip(),
+                         'afact': xwalk[factor_col].astype(float)})
+
+
+def ami_lookup(xwalk, areas, limits, max_persons = 20):
+    # Precomputed lookup: sorted (ST, PUMA) keys and their (3 bands x PUMAs
+    # x sizes 1..max_persons) limits, each the afact-weighted mean over the
+    # PUMA's areas with limits
+    row = areas.get_indexer(xwalk['area'].values)
+    xwalk = xwalk[row >= 0]
+    row = row[row >= 0]
+    (codes, keys) = pd.factorize(_puma_key(xwalk['ST'].values, xwalk['PUMA'].values), sort = True)
+    afact = xwalk['afact'].values
+    table = np.zeros((len(keys), limits.shape[1]*limits.shape[2]))
+    np.add.at(table, codes, afact[:, None]*limits[row].reshape(len(row), -1))
+    table /= np.bincount(codes, weights = afact, minlength = len(keys))[:, None]
+    table = table.reshape(len(keys), limits.shape[1], limits.shape[2])
+    # Beyond 8 persons, 8% of the 4-person limit per extra person
+    extra = 0.08*np.arange(1, max_persons - 7)
+    table = np.concatenate([table, table[:, :, 7:8] + extra*table[:, :, 3:4]], axis = 2)
+    return {'keys': np.asarray(keys), 'limits': np.ascontiguousarray(table.transpose(1, 0, 2))}
+
+
+def _puma_key(st, puma):
+    # int64 key of (ST, PUMA)
+    return np.asarray(st, dtype = np.int64)*100000 + np.asarray(puma, dtype = np.int64)
+
+
+def ami_band(lookup, st, puma, persons, income):
+    # AMI band code (see module docstring) of each household, float32: one
+    # binary search for the PUMA, then a gather of each band's limit
+    persons = np.asarray(persons, dtype = np.float64)
+    income = np.asarray(income, dtype = np.float64)
+    (keys, limits) = (lookup['keys'], lookup['limits'])
+    hhkeys = _puma_key(st, puma)
+    pos = np.searchsorted(keys, hhkeys).clip(max = len(keys) - 1)
+    found = keys[pos] == hhkeys
+    at = pos*limits.shape[2] + np.nan_to_num(persons).clip(1, limits.shape[2]).astype(np.intp) - 1
+
+    # Number of limits the income is above picks the band
+    above = np.zeros(len(hhkeys), dtype = np.intp)
+    for band in limits:
+        above += income > band.ravel()[at]
+    code = np.asarray(AMI_BANDS + [AMI_ABOVE], dtype = np.float32)[above]
+    code[~found | np.isnan(income) | ~(persons >= 1)] = AMI_NA
+    return code
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo sizing of homeshare matching from supply and demand cohorts.
+
+The matches a program can make in a PUMA depend on how many supply
+households (hosts) and demand households (seekers) there are, and on what
+share of each takes part and is matched. Each scenario draws the PUMA's
+supply and demand totals from their replicate-weight distribution and the
+rates from their assumed ranges, and counts
+    matches = match rate * min(host rate * supply, seeker rate * demand)
+Totals are drawn as est + sqrt(4/80) * sum_r z_r (WGTP_r total - est), z_r
+standard normal, which has the replicate (rep_est) variance of each total
+and the covariance of supply and demand; draws below 0 are clipped. A rate
+given as (low, high) is drawn uniformly, a single value is fixed.
+
+The household weight matrix is written once to .npy files in shared_dir
+and memory-mapped read-only by the worker processes, so all workers read
+one copy from the page cache and none reloads or copies the PUMS data.
+Rows are sorted by PUMA, so each PUMA is a contiguous slice. Each PUMA has
+its own random stream, seeded from seed and the PUMA, so results do not
+depend on the number of processes.
+
+Usage:
+    python match_sim.py matches.csv psam_h25.csv --supply hh12p60o_2r --demand dm_rent1p_rb30 \\
+        --draws 10000 --host-rate 0.02 0.05 --seeker-rate 0.05 0.1 --match-rate 0.5 0.8
+"""
+
+
+import argparse
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from cohort_query import load_query_table, query_mask
+
+# Placeholder rate assumptions (low, high); set them for the program
+HOST_RATE = (0.01, 0.05)
+SEEKER_RATE = (0.01, 0.05)
+MATCH_RATE = (0.3, 0.7)
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Worker state: the memory-mapped arrays
+_shared = {}
+
+
+def load_match_data(hhfile, supply, demand, pfile = None, cache_dir = None):
+    # (ST, PUMA) geographies, row offset of each, and the PUMA-sorted
+    # weight matrix and (households x 2) supply/demand masks
+    state = load_query_table(hhfile, pfile, columns = ['ST'], cache_dir = cache_dir)
+    masks = np.column_stack([query_mask(state, {'cohort': supply}), query_mask(state, {'cohort': demand})])
+    keys = state['table']['ST'].values*100000 + state['table']['PUMA'].values
+    order = np.argsort(keys, kind = 'stable')
+    (geos, starts) = np.unique(keys[order], return_index = True)
+    return {'geos': pd.MultiIndex.from_arrays([geos//100000, geos % 100000], names = ['ST', 'PUMA']),
+            'bounds': np.append(starts, len(keys)),
+            'wgts': state['wgts'][order],
+            'masks': masks[order]}
+
+
+def _attach(paths):
+    # Worker initializer: map the shared arrays once per process
+    for (name, path) in paths.items():
+        _shared[name] = np.load(path, mmap_mode = 'r')
+
+
+def _draw_rate(rng, rate, draws):
+    # draws of a (low, high) uniform rate, or of a fixed one
+    if np.ndim(rate) == 0:
+        return np.full(draws, float(rate))
+    return rng.uniform(rate[0], rate[1], draws)
+
+
+def _simulate_pumas(block, bounds, seeds, draws, rates, quantiles):
+    # Worker: (PUMAs x (supply, demand, mean, quantiles)) for the PUMAs in
+    # block, read from the shared arrays
+    (wgts, masks) = (_shared['wgts'], _shared['masks'])
+    results = np.zeros((len(block), 3 + len(quantiles)))
+    for (i, k) in enumerate(block):
+        rows = slice(bounds[k], bounds[k + 1])
+        totals = masks[rows].T.astype(np.float64) @ wgts[rows]
+        rng = np.random.default_rng(seeds[k])
+        # Supply and demand totals with the replicate covariance
+        deviations = totals[:, 1:] - totals[:, :1]
+        z = rng.standard_normal((draws, deviations.shape[1]))
+        sims = np.maximum(totals[:, 0] + np.sqrt(4/80)*(z @ deviations.T), 0)
+        (host, seeker, match) = [_draw_rate(rng, rate, draws) for rate in rates]
+        matches = match*np.minimum(host*sims[:, 0], seeker*sims[:, 1])
+        results[i] = np.concatenate([totals[:, 0], [matches.mean()], np.quantile(matches, quantiles)])
+    return results
+
+
+def simulate_matches(data, draws = 10000, host_rate = HOST_RATE, seeker_rate = SEEKER_RATE,
+                     match_rate = MATCH_RATE, quantiles = QUANTILES, processes = None, seed = 0,
+                     shared_dir = None):
+    # One row per PUMA: supply and demand estimates, and the mean and
+    # quantiles of the simulated matches (matches_p5, matches_p50, ...)
+    geos = data['geos']
+    seeds = [(seed,) + tuple(int(x) for x in geo) for geo in geos]
+    processes = processes or os.cpu_count() or 1
+    blocks = [block for block in np.array_split(np.arange(len(geos)), 4*processes) if len(block)]
+
+    with tempfile.TemporaryDirectory(dir = shared_dir) as tmpdir:
+        paths = {}
+        for name in ['wgts', 'masks']:
+            paths[name] = os.path.join(tmpdir, name + '.npy')
+            np.save(paths[name], data[name])
+        with ProcessPoolExecutor(max_workers = processes, initializer = _attach, initargs = (paths,)) as pool:
+            parts = list(pool.map(_simulate_pumas, blocks, repeat(data['bounds']), repeat(seeds), repeat(draws),
+                                  repeat((host_rate, seeker_rate, match_rate)), repeat(list(quantiles))))
+
+    columns = ['supply', 'demand', 'matches_mean'] + ['matches_p%g' % (100*q) for q in quantiles]
+    results = pd.DataFrame(np.concatenate(parts), columns = columns)
+    return pd.concat([geos.to_frame(index = False), results], axis = 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Monte Carlo homeshare matches by PUMA from PUMS replicate weights')
+    parser.add_argument('output', help = 'csv of simulated matches by ST and PUMA')
+    parser.add_argument('hhfile', help = 'PUMS housing csv')
+    parser.add_argument('--pfile', default = None, help = 'PUMS person csv, for householder cohorts')
+    parser.add_argument('--supply', default = 'hh12p60o_2r', help = 'supply (host) cohort')
+    parser.add_argument('--demand', default = 'dm_rent1p_rb30', help = 'demand (seeker) cohort')
+    parser.add_argument('--draws', type = int, default = 10000, help = 'scenarios per PUMA')
+    parser.add_argument('--host-rate', type = float, nargs = '+', default = HOST_RATE, help = 'rate or low high')
+    parser.add_argument('--seeker-rate', type = float, nargs = '+', default = SEEKER_RATE, help = 'rate or low high')
+    parser.add_argument('--match-rate', type = float, nargs = '+', default = MATCH_RATE, help = 'rate or low high')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: CPU count)')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--shared-dir', default = None, help = 'directory for the shared arrays (e.g. /dev/shm)')
+    parser.add_argument('--cache-dir', default = None, help = 'parsed-input cache (see pums_load)')
+    args = parser.parse_args()
+
+    rates = [rate[0] if len(rate) == 1 else tuple(rate) for rate in [args.host_rate, args.seeker_rate,
+                                                                       args.match_rate]]
+    data = load_match_data(args.hhfile, args.supply, args.demand, args.pfile, args.cache_dir)
+    simulate_matches(data, args.draws, *rates, processes = args.processes, seed = args.seed,
+                     shared_dir = args.shared_dir).to_csv(args.output, index = False)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-state and national runs of the homeshare supply cube.
+
+Each PUMS housing file (a state file such as psam_h25.csv, or one part of the
+national psam_husa..husd set) is tagged and collapsed to (ST, PUMA) x flag
+cells in its own worker process. The cell sums are additive, so the parts
+are merged and the full cube for every PUMA in every state is estimated
+once at the end.
+
+Usage:
+    python multistate.py output.csv psam_h09.csv psam_h23.csv psam_h25.csv ...
+"""
+
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from cohort_spec import HOMESHARE_COHORTS, HOMESHARE_NAME, TOTAL_COHORTS, TOTAL_NAME, compile_cohorts, spec_thresholds
+from cube_engine import cell_totals, cell_totals_chunked, cube_frame, puma_cube, tag_households
+from pums_load import hh_columns, iter_hhpums, load_hhpums
+from replicate_est import WGTP_COLS
+
+
+def file_cells(hhfile, usecols, cb_thresholds, chunksize = None):
+    # Worker: (ST, PUMA) x flag cells for one PUMS housing file
+    if chunksize:
+        return cell_totals_chunked(iter_hhpums(hhfile, usecols = usecols, chunksize = chunksize),
+                                   cb_thresholds = cb_thresholds)
+    hhpums = load_hhpums(hhfile, usecols = usecols)
+    return cell_totals(tag_households(hhpums, cb_thresholds = cb_thresholds), hhpums[WGTP_COLS])
+
+
+def merge_cells(parts):
+    # Sum cell tables from several files; cells with the same key are added
+    keys = pd.concat([part[0] for part in parts], ignore_index = True)
+    wgts = pd.DataFrame(np.concatenate([part[1] for part in parts]), columns = WGTP_COLS)
+    cells = wgts.groupby([keys[col].values for col in keys.columns], sort = True).sum()
+    cells.index.names = list(keys.columns)
+    return cells.index.to_frame(index = False), cells.values
+
+
+def multistate_cube(hhfiles, spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME,
+                    processes = None, chunksize = None):
+    # (ST, PUMA) geographies, cohort names and replicate cube for all files,
+    # with files spread across a process pool
+    usecols = hh_columns([TOTAL_COHORTS, spec], extra = ['ST'])
+    cb_thresholds = spec_thresholds(spec, 'cb')
+    with ProcessPoolExecutor(max_workers = processes) as pool:
+        parts = list(pool.map(file_cells, hhfiles, repeat(usecols),
+                              repeat(cb_thresholds), repeat(chunksize)))
+    (cells, cellwgts) = merge_cells(parts)
+
+    cohort_masks = compile_cohorts(cells, TOTAL_COHORTS, TOTAL_NAME)
+    cohort_masks.update(compile_cohorts(cells, spec, name))
+    (geos, cube) = puma_cube(cells, cellwgts, np.column_stack(list(cohort_masks.values())),
+                             geo_cols = ('ST', 'PUMA'))
+    return geos, list(cohort_masks), cube
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Homeshare supply estimates for every PUMA in several PUMS housing files')
+    parser.add_argument('output', help = 'csv of estimates by ST, PUMA and cohort')
+    parser.add_argument('hhfiles', nargs = '+', help = 'PUMS housing csv files (state or national parts)')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type = int, default = None, help = 'stream each file in chunks of this many rows')
+    args = parser.parse_args()
+
+    (geos, cohorts, cube) = multistate_cube(args.hhfiles, processes = args.processes, chunksize = args.chunksize)
+    cube_frame(geos, cohorts, cube).to_csv(args.output, index = False)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Long-format output tables and atomic, background file writes.
+
+long_frame turns a replicate cube into one tidy table: geography, cohort
+and its dimension levels, est, moe, moep, lower, upper, optionally the
+share of a base cohort (occupied units) and its MoE, and the WGTP and WGTP1..80 totals, one
+row per geography x cohort. Wide report tables are
+views of it. ratio_frame is the same layout for ratios between cohort pairs
+(supply per unit of demand), with MoEs from the replicate ratios.
+
+Writes go through a single background thread so computation carries on
+while a slow network share catches up. Every file is written to a temporary
+name in its destination directory and renamed over the target when
+complete, so readers never see a half-written file and an interrupted run
+leaves the previous version in place. Formats:
+    parquet    pyarrow (optional dependency)
+    csv
+    xlsx       openpyxl (optional dependency)
+"""
+
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from cube_engine import cube_est
+from replicate_est import WGTP_COLS, proportion_est, ratio_est
+
+EST_COLS = ['est', 'moe', 'moep', 'lower', 'upper']
+
+# Formats for the long table when none are configured
+LONG_FORMATS = ['parquet'] if pyarrow is not None else ['csv']
+
+
+def long_frame(geos, cohorts, cube, levels = None, geo_type = None, share_of = None):
+    # Tidy table of a (geos x cohorts x 81) cube. levels: frame of cohort
+    # dimension levels (see cohort_spec.cohort_levels) joined on cohort;
+    # geo_type as in _geo_rows. With share_of (a cohort, e.g. hhs_occ),
+    # each cohort's percent share of it and the share's MoE are added.
+    cohorts = list(cohorts)
+    cube = np.asarray(cube)
+    frame = _geo_rows(geos, len(cohorts), geo_type)
+    frame['cohort'] = np.tile(cohorts, len(geos))
+    if levels is not None:
+        frame = frame.merge(levels, on = 'cohort', how = 'left', sort = False)
+    est = cube_est(cube).reshape(-1, 5)
+    # cube_est order is est, moe, moep, upper, lower
+    for (j, col) in zip([0, 1, 2, 4, 3], EST_COLS):
+        frame[col] = est[:, j]
+    if share_of is not None:
+        whole = np.broadcast_to(cube[:, [cohorts.index(share_of)]], cube.shape)
+        share = proportion_est(cube.reshape(-1, cube.shape[-1]), whole.reshape(-1, cube.shape[-1]))
+        frame['share'] = share[0]
+        frame['share_moe'] = share[1]
+    reps = pd.DataFrame(cube.reshape(-1, cube.shape[-1]), columns = WGTP_COLS)
+    return pd.concat([frame, reps], axis = 1)
+
+
+def ratio_frame(geos, cohorts, cube, pairs, geo_type = None):
+    # Tidy table of ratios between cohort pairs of a (geos x cohorts x 81)
+    # cube: one row per geography x (numerator, denominator) pair with both
+    # estimates and the ratio's est, moe, moep, lower and upper
+    cohorts = list(cohorts)
+    cube = np.asarray(cube)
+    num = cube[:, [cohorts.index(a) for (a, _) in pairs]].reshape(-1, cube.shape[-1])
+    den = cube[:, [cohorts.index(b) for (_, b) in pairs]].reshape(-1, cube.shape[-1])
+    frame = _geo_rows(geos, len(pairs), geo_type)
+    frame['numerator'] = np.tile([a for (a, _) in pairs], len(geos))
+    frame['denominator'] = np.tile([b for (_, b) in pairs], len(geos))
+    frame['numerator_est'] = num[:, 0]
+    frame['denominator_est'] = den[:, 0]
+    ratio = ratio_est(num, den)
+    # ratio_est order is est, moe, moep, upper, lower
+    for (j, col) in zip([0, 1, 2, 4, 3], EST_COLS):
+        frame[col] = ratio[j]
+    return frame
+
+
+def _geo_rows(geos, n, geo_type = None):
+    # Geography columns repeated n times per geography. With geo_type,
+    # geography is two columns, geo_type and geo (as text), so PUMAs,
+    # regions and tracts can share one table.
+    geo = geos.to_frame(index = False)
+    if geo_type is not None:
+        geo = pd.DataFrame({'geo_type': geo_type,
+                            'geo': ['-'.join(row) for row in geo.astype(str).values]})
+    return geo.loc[geo.index.repeat(n)].reset_index(drop = True)
+
+
+def atomic_write(frame, path, fmt = None, **kwargs):
+    # Write frame to path through a temporary file renamed into place.
+    # fmt defaults to path's extension (parquet, csv or xlsx).
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    # Same directory (so the rename is atomic), unique per process and thread
+    (base, ext) = os.path.splitext(os.path.basename(path))
+    tmppath = os.path.join(os.path.dirname(os.path.abspath(path)),
+                           '.%s-%d-%d.tmp%s' % (base, os.getpid(), threading.get_ident(), ext))
+    try:
+        if fmt == 'parquet':
+            frame.to_parquet(tmppath, **kwargs)
+        elif fmt == 'csv':
+            frame.to_csv(tmppath, **kwargs)
+        elif fmt in ('xlsx', 'excel'):
+            if isinstance(frame, dict):
+                # Several sheets: {sheet name: frame}
+                with pd.ExcelWriter(tmppath) as xl:
+                    for (sheet, sheetframe) in frame.items():
+                        sheetframe.to_excel(xl, sheet_name = sheet, **kwargs)
+            else:
+                frame.to_excel(tmppath, **kwargs)
+        else:
+            raise ValueError('unknown output format %r' % fmt)
+        os.replace(tmppath, path)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+    return path
+
+
+def start_writer():
+    # Background writer: one thread, so files are written in submission order
+    return {'pool': ThreadPoolExecutor(max_workers = 1), 'pending': []}
+
+
+def write_async(writer, frame, path, fmt = None, **kwargs):
+    # Queue an atomic_write; without a writer, write now. The frame must
+    # not be modified after it is queued.
+    if writer is None:
+        return atomic_write(frame, path, fmt, **kwargs)
+    writer['pending'].append(writer['pool'].submit(atomic_write, frame, path, fmt, **kwargs))
+
+
+def finish_writes(writer):
+    # Wait for every queued write; re-raises the first failure
+    if writer is None:
+        return []
+    try:
+        return [future.result() for future in writer['pending']]
+    finally:
+        writer['pending'] = []
+        writer['pool'].shutdown(wait = True)
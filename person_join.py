@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Householder features from the PUMS person file.
+
+The household R60/R65 flags count any 60+/65+ person, not the householder.
+This stage streams the person file (about 2.5x the housing file) in chunks,
+keeps only each household's reference person and reduces them to compact
+per-household columns:
+    HHAGE: householder age
+    HHDIS: householder has a disability (DIS == 1)
+    HHEMP: householder is employed (ESR 1, 2, 4 or 5)
+    HHSCH: householder is enrolled in college or graduate school (SCHG 15, 16)
+The reduced table is sorted by an int64 SERIALNO key once, and housing rows
+(or chunks) are joined to it with a binary search, so the person file is
+never held in memory.
+
+PUMS fields:
+    SERIALNO: Housing unit/GQ person serial number (2014 numeric, 2018HU/2018GQ)
+    RELP: Relationship (00 = reference person), through 2018 files
+    RELSHIPP: Relationship (20 = reference person), 2019 and later files
+    AGEP: Age
+    DIS: Disability recode (1 = with a disability, 2 = without)
+    ESR: Employment status recode (1, 2 = civilian employed, 4, 5 = armed forces)
+    SCHG: Grade level attending (15 = undergraduate, 16 = graduate or professional school)
+"""
+
+
+import numpy as np
+import pandas as pd
+
+P_DTYPES = {'SERIALNO': str,
+            'RELP': 'UInt8',
+            'RELSHIPP': 'UInt8',
+            'AGEP': 'UInt8',
+            'DIS': 'UInt8',
+            'ESR': 'UInt8',
+            'SCHG': 'UInt8'}
+
+
+def serial_key(serialno):
+    # int64 key from SERIALNO strings: 2018HU0000023 -> 2018010000023,
+    # 2018GQ0000007 -> 2018020000007, numeric serials unchanged
+    serialno = pd.Series(serialno).astype(str)
+    serialno = serialno.str.replace('HU', '01', regex = False).str.replace('GQ', '02', regex = False)
+    return serialno.astype(np.int64).values
+
+
+def householder_features(pfile, chunksize = 500000, **kwargs):
+    # Compact per-household householder features, sorted by SERIALNO key
+    header = pd.read_csv(pfile, nrows = 0).columns
+    relcol = 'RELSHIPP' if 'RELSHIPP' in header else 'RELP'
+    refcode = 20 if relcol == 'RELSHIPP' else 0
+    usecols = ['SERIALNO', relcol, 'AGEP', 'DIS', 'ESR', 'SCHG']
+    dtypes = {col: P_DTYPES[col] for col in usecols}
+
+    parts = []
+    reader = pd.read_csv(pfile, usecols = usecols, dtype = dtypes, chunksize = chunksize, **kwargs)
+    with reader:
+        for chunk in reader:
+            ref = chunk.loc[(chunk[relcol] == refcode).fillna(False).values]
+            parts.append(pd.DataFrame({'key': serial_key(ref['SERIALNO']),
+                                       'HHAGE': ref['AGEP'].fillna(0).astype(np.uint8).values,
+                                       'HHDIS': (ref['DIS'] == 1).fillna(False).values,
+                                       'HHEMP': ref['ESR'].isin([1, 2, 4, 5]).fillna(False).values,
+                                       'HHSCH': ref['SCHG'].isin([15, 16]).fillna(False).values}))
+    features = pd.concat(parts, ignore_index = True)
+    return features.sort_values('key', kind = 'stable').reset_index(drop = True)
+
+
+def join_householder(hhpums, features):
+    # Add HHAGE, HHDIS, HHEMP and HHSCH to hhpums (in place) joined on SERIALNO;
+    # HHAGE is N/A where the household has no reference person (vacant units)
+    keys = serial_key(hhpums['SERIALNO'])
+    fkeys = features['key'].values
+    pos = np.searchsorted(fkeys, keys).clip(max = len(fkeys) - 1)
+    found = fkeys[pos] == keys
+
+    hhage = pd.array(features['HHAGE'].values[pos], dtype = 'UInt8')
+    hhage[~found] = pd.NA
+    hhpums['HHAGE'] = hhage
+    hhpums['HHDIS'] = found & features['HHDIS'].values[pos]
+    hhpums['HHEMP'] = found & features['HHEMP'].values[pos]
+    hhpums['HHSCH'] = found & features['HHSCH'].values[pos]
+    return hhpums
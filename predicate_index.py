@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Packed bitset index of household predicates.
+
+Each predicate (a cohort_spec level such as owned, NP == 1, BDSP >= 2 or
+OCPIP >= 40) is evaluated over the household rows once and stored as a
+packed bit array, n/8 bytes for n households. A cohort or query is the
+bitwise AND of its predicates' bit arrays, unpacked into one boolean mask
+that selects the weight rows to sum, so no filtered copy of the household
+table is made. Memory grows with the number of distinct predicates, not
+cohorts, and the least recently used predicates are dropped beyond
+max_bits.
+
+    index = new_index(table)
+    bits = cohort_bits(index, HOMESHARE_COHORTS, HOMESHARE_NAME, 'hh1p65o_3r')
+    bits &= level_bits(index, {'OCPIP': ('>=', 40)})
+    totals = masked_totals(wgts, unpack(index, bits))
+"""
+
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from cohort_spec import cohort_key, level_mask
+
+
+def new_index(data, max_bits = 4096):
+    # Empty index over the rows of data (a frame or dict of columns)
+    return {'data': data, 'n': len(data), 'bits': OrderedDict(), 'max_bits': max_bits, 'lock': threading.Lock()}
+
+
+def _level_key(level):
+    # Hashable form of a level (dict of conditions, or list of them)
+    if isinstance(level, list):
+        return ('any',) + tuple(_level_key(lvl) for lvl in level)
+    return tuple(sorted((col, tuple(cond) if isinstance(cond, list) else cond) for (col, cond) in level.items()))
+
+
+def level_bits(index, level):
+    # Packed bits of the rows meeting a level; evaluated once per index
+    key = _level_key(level)
+    with index['lock']:
+        bits = index['bits'].get(key)
+        if bits is not None:
+            index['bits'].move_to_end(key)
+            return bits.copy()
+    bits = np.packbits(level_mask(index['data'], level))
+    with index['lock']:
+        index['bits'][key] = bits
+        if len(index['bits']) > index['max_bits']:
+            index['bits'].popitem(last = False)
+    return bits.copy()
+
+
+def cohort_bits(index, spec, name, cohort):
+    # Packed bits of a named cohort: the AND of its levels' bits
+    key = cohort_key(spec, name, cohort)
+    bits = all_bits(index)
+    for (dim, lvl) in key.items():
+        bits &= level_bits(index, spec[dim][lvl])
+    return bits
+
+
+def all_bits(index):
+    # Packed bits with every row set
+    return np.packbits(np.ones(index['n'], dtype = bool))
+
+
+def unpack(index, bits):
+    # Boolean row mask from packed bits
+    return np.unpackbits(bits, count = index['n']).view(bool)
+
+
+def masked_totals(wgts, mask):
+    # (81,) weight totals of the masked rows. Only those rows are read (a
+    # masked reduction over every row, np.sum(where = ...), is several times
+    # slower for the small cohorts queried).
+    return wgts[np.flatnonzero(mask)].sum(axis = 0, dtype = np.int64)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage instrumentation of a run.
+
+A run report records, for each named stage, its wall time, CPU time, peak
+memory and the rows going in and out. Memory is the process RSS high-water
+mark after the stage (resource, or psutil on Windows). With memory = True,
+allocations are also traced with tracemalloc (numpy and pandas buffers
+included), reset at the start of every stage so each stage reports its own
+peak; tracing slows parsing several-fold, so it is for diagnostic runs.
+Stages may nest (a stage that computes another on the way): each reports
+its own time, excluding the stages nested in it, so stage times add up to
+the run, and the peak over its whole span. Reports are written as JSON or
+CSV. With profile = True the whole run is also profiled with
+cProfile and saved next to the report as a .prof file (viewable as a flame
+graph with snakeviz or flameprof).
+
+    report = new_report()
+    stage_start(report, 'load')
+    hhpums = load_hhpums(...)
+    stage_end(report, 'load', rows_out = len(hhpums))
+    write_report(report, 'run_report.json')
+"""
+
+
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPORT_FIELDS = ['stage', 'wall_sec', 'cpu_sec', 'peak_traced_mb', 'peak_rss_mb', 'rows_in', 'rows_out']
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process in MB (None where unavailable)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        return round(peak/(1 << 20) if sys.platform == 'darwin' else peak/(1 << 10), 1)
+    if psutil is not None:
+        # Windows reports the peak working set
+        meminfo = psutil.Process().memory_info()
+        return round(getattr(meminfo, 'peak_wset', meminfo.rss)/(1 << 20), 1)
+    return None
+
+
+def new_report(memory = False, profile = False):
+    # Empty run report; memory traces allocations for per-stage peaks and
+    # profile runs cProfile until write_report
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': [], 'open': [],
+            'memory': memory, 'profiler': profiler}
+
+
+def _traced_peak(report):
+    # Traced allocation peak since the last reset, None when not tracing
+    if report['memory'] and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1]
+    return None
+
+
+def _max_peak(a, b):
+    return a if b is None else b if a is None else max(a, b)
+
+
+def stage_start(report, name, rows_in = None):
+    # Start timing stage name, nested in any stage still open
+    if report['open']:
+        # Keep the enclosing stage's peak so far before resetting it
+        report['open'][-1]['peak'] = _max_peak(report['open'][-1]['peak'], _traced_peak(report))
+    if report['memory'] and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    report['open'].append({'name': name, 'wall': time.perf_counter(), 'cpu': time.process_time(),
+                           'nested_wall': 0.0, 'nested_cpu': 0.0, 'peak': None, 'rows_in': rows_in})
+
+
+def add_rows_in(report, rows):
+    # Count rows going into the innermost open stage
+    if report['open'] and rows is not None:
+        report['open'][-1]['rows_in'] = (report['open'][-1]['rows_in'] or 0) + rows
+
+
+def stage_end(report, name, rows_out = None):
+    # Stop timing stage name, the innermost open stage, and record it
+    current = report['open'].pop()
+    if current['name'] != name:
+        raise ValueError('stage %r ended while %r is open' % (name, current['name']))
+    wall = time.perf_counter() - current['wall']
+    cpu = time.process_time() - current['cpu']
+    peak = _max_peak(current['peak'], _traced_peak(report))
+    if report['open']:
+        report['open'][-1]['nested_wall'] += wall
+        report['open'][-1]['nested_cpu'] += cpu
+        report['open'][-1]['peak'] = _max_peak(report['open'][-1]['peak'], peak)
+    report['stages'].append({'stage': name,
+                             'wall_sec': round(wall - current['nested_wall'], 4),
+                             'cpu_sec': round(cpu - current['nested_cpu'], 4),
+                             'peak_traced_mb': None if peak is None else round(peak/(1 << 20), 1),
+                             'peak_rss_mb': peak_rss_mb(),
+                             'rows_in': current['rows_in'],
+                             'rows_out': rows_out})
+
+
+@contextmanager
+def stage(report, name, rows_in = None):
+    # Context manager form of stage_start/stage_end; set rows_out on the
+    # yielded dict
+    counts = {'rows_out': None}
+    stage_start(report, name, rows_in)
+    try:
+        yield counts
+    finally:
+        stage_end(report, name, counts['rows_out'])
+
+
+def write_report(report, reportfile):
+    # Write the stages as JSON (.json) or CSV (anything else); a profiled run
+    # also writes reportfile's stem + .prof
+    if report['profiler'] is not None:
+        report['profiler'].disable()
+        report['profiler'].dump_stats(os.path.splitext(reportfile)[0] + '.prof')
+    if reportfile.endswith('.json'):
+        with open(reportfile, 'w') as f:
+            json.dump({'started': report['started'], 'stages': report['stages']}, f, indent = 1)
+    else:
+        pd.DataFrame(report['stages'], columns = REPORT_FIELDS).to_csv(reportfile, index = False)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Loading PUMS housing files.
+
+Only the columns the cohort spec needs are read, with compact dtypes:
+    PUMA            category (parsed as int, so codes such as 00506 match 506)
+    flags/codes     UInt8 (nullable, blank = N/A for GQ/vacant units)
+    weights         int32 (int16 would silently wrap on large weights)
+A full PUMS housing file has a few hundred columns parsed as int64/float64/
+object by default; the projected load is a small fraction of that.
+
+load_hhpums_cached keeps a local Feather (Arrow IPC) snapshot of the parsed
+columns so later runs memory-map it instead of re-parsing the csv. The
+snapshot is keyed on the source file's size, mtime and content hash, the
+hash memoized (source_fingerprint) so a source is read once to hash it.
+"""
+
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+from cohort_spec import HOMESHARE_COHORTS, spec_columns
+from cube_engine import PERSON_TAGS, TAG_SOURCES
+from replicate_est import WGTP_COLS
+
+# Compact dtypes for the PUMS housing fields we use
+HH_DTYPES = {'PUMA': np.int32,
+             'PUMA00': np.int32,
+             'PUMA10': np.int32,
+             'PUMA20': np.int32,
+             'ST': 'UInt8',
+             'TYPE': 'UInt8',
+             'TYPEHUGQ': 'UInt8',
+             'TEN': 'UInt8',
+             'NP': 'UInt8',
+             'BDSP': 'UInt8',
+             'BDS': 'UInt8',
+             'R60': 'UInt8',
+             'R65': 'UInt8',
+             'OCPIP': 'UInt8',
+             'GRPIP': 'UInt8',
+             'PARTNER': 'UInt8',
+             'HHT': 'UInt8',
+             'SSMC': 'UInt8',
+             'HINCP': 'Int32',
+             'ADJINC': 'Int32',
+             'SERIALNO': str}
+HH_DTYPES.update({col: np.int32 for col in WGTP_COLS})
+
+
+def hh_columns(spec = HOMESHARE_COHORTS, extra = ()):
+    # Raw housing columns needed to tag households for spec (or a list of
+    # specs), plus weights.
+    # Householder flags come from the person file, joined on SERIALNO.
+    cols = ['PUMA']
+    for tag in spec_columns(spec):
+        if tag in PERSON_TAGS:
+            if 'SERIALNO' not in cols:
+                cols.append('SERIALNO')
+            continue
+        for col in TAG_SOURCES.get(tag, [tag]):
+            if col not in cols:
+                cols.append(col)
+    cols += [col for col in extra if col not in cols]
+    return cols + WGTP_COLS
+
+
+def _hh_dtypes(usecols):
+    # read_csv dtypes for the known columns in usecols
+    return {col: HH_DTYPES[col] for col in usecols if col in HH_DTYPES}
+
+
+def load_hhpums(hhfile, usecols = None, **kwargs):
+    # Column-projected, dtype-optimized read of a PUMS housing csv
+    if usecols is None:
+        usecols = hh_columns()
+    hhpums = pd.read_csv(hhfile, usecols = usecols, dtype = _hh_dtypes(usecols), **kwargs)
+    if 'PUMA' in hhpums:
+        hhpums['PUMA'] = hhpums['PUMA'].astype('category')
+    return hhpums
+
+
+def iter_hhpums(hhfile, usecols = None, chunksize = 500000, **kwargs):
+    # Stream a PUMS housing csv as chunks of chunksize rows, with the same
+    # column projection and dtypes as load_hhpums
+    if usecols is None:
+        usecols = hh_columns()
+    reader = pd.read_csv(hhfile, usecols = usecols, dtype = _hh_dtypes(usecols),
+                         chunksize = chunksize, **kwargs)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+def file_fingerprint(path, blocksize = 1 << 23):
+    # Size, mtime and sha256 content hash of a file
+    stat = os.stat(path)
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+
+
+def source_fingerprint(path, cache_dir = None):
+    # file_fingerprint, memoized in cache_dir by path, size and mtime so an
+    # unchanged source is not rehashed on every run
+    if cache_dir is None:
+        return file_fingerprint(path)
+    memofile = os.path.join(cache_dir, 'fingerprints.json')
+    memo = {}
+    if os.path.exists(memofile):
+        with open(memofile) as f:
+            memo = json.load(f)
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    found = memo.get(key)
+    if found is None or found['size'] != stat.st_size or found['mtime'] != stat.st_mtime_ns:
+        found = file_fingerprint(path)
+        memo[key] = found
+        os.makedirs(cache_dir, exist_ok = True)
+        with open(memofile + '.tmp', 'w') as f:
+            json.dump(memo, f)
+        os.replace(memofile + '.tmp', memofile)
+    return found
+
+
+def _cache_paths(hhfile, cache_dir):
+    # Snapshot and metadata paths for a source file
+    key = hashlib.sha256(os.path.abspath(hhfile).encode('utf-8')).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(hhfile))[0] + '-' + key
+    return (os.path.join(cache_dir, stem + '.feather'), os.path.join(cache_dir, stem + '.json'))
+
+
+def _cache_valid(hhfile, meta, cache_dir):
+    # Size and mtime must match; on an mtime-only change fall back to the hash
+    stat = os.stat(hhfile)
+    if meta.get('size') != stat.st_size:
+        return False
+    if meta.get('mtime') == stat.st_mtime_ns:
+        return True
+    return source_fingerprint(hhfile, cache_dir)['sha256'] == meta.get('sha256')
+
+
+def load_hhpums_cached(hhfile, usecols = None, cache_dir = None, **kwargs):
+    # load_hhpums through a local columnar snapshot of the parsed csv.
+    # The snapshot is rebuilt when the source changes or lacks a requested
+    # column. Without pyarrow (or cache_dir) this is a plain load_hhpums.
+    if usecols is None:
+        usecols = hh_columns()
+    if feather is None or cache_dir is None:
+        return load_hhpums(hhfile, usecols = usecols, **kwargs)
+
+    (snapfile, metafile) = _cache_paths(hhfile, cache_dir)
+    meta = None
+    if os.path.exists(snapfile) and os.path.exists(metafile):
+        with open(metafile) as f:
+            meta = json.load(f)
+        if set(usecols) <= set(meta['columns']) and _cache_valid(hhfile, meta, cache_dir):
+            mtime = os.stat(hhfile).st_mtime_ns
+            if meta['mtime'] != mtime:
+                # Touched but unchanged: record the new mtime to skip rehashing
+                meta['mtime'] = mtime
+                with open(metafile, 'w') as f:
+                    json.dump(meta, f)
+            table = feather.read_table(snapfile, columns = list(usecols), memory_map = True)
+            return table.to_pandas(split_blocks = True)
+
+    # (Re)build, keeping any columns the old snapshot already held
+    cols = list(usecols)
+    if meta is not None:
+        cols += [col for col in meta['columns'] if col not in cols]
+    hhpums = load_hhpums(hhfile, usecols = cols, **kwargs)
+    os.makedirs(cache_dir, exist_ok = True)
+    # Write to a temporary name first so an interrupted run never leaves a
+    # half-written snapshot behind
+    feather.write_feather(hhpums, snapfile + '.tmp', compression = 'uncompressed')
+    os.replace(snapfile + '.tmp', snapfile)
+    # The memoized fingerprint, so a source cube_key has just hashed is not
+    # read again
+    meta = dict(source_fingerprint(hhfile, cache_dir))
+    meta['columns'] = list(hhpums.columns)
+    with open(metafile, 'w') as f:
+        json.dump(meta, f)
+    return hhpums[list(usecols)]
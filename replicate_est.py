@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Replicate-weight estimators for PUMS housing unit counts and derived statistics.
+
+Estimates use the Census successive difference replication formula:
+    MoE = 1.645 * sqrt((4/80) * sum_r (WGTP_r - WGTP)^2)
+where WGTP is the full-sample total and WGTP_r (r = 1..80) are the
+replicate totals. Every function here works on a (rows x 81) weight matrix
+ordered as WGTP_COLS, so any number of subsets can be estimated from a
+single matrix reduction.
+
+Derived estimates apply the same formula to their 81 replicate versions,
+each computed with the matching weight:
+    ratio_est         ratio of two totals (e.g. supply per demand household)
+    proportion_est    share of a total, in percent
+    mean_est          weighted mean of a value
+    quantile_est      weighted quantile (e.g. median) of a value
+"""
+
+
+import numpy as np
+
+# Full-sample weight followed by the 80 replicate weights
+WGTP_COLS = ['WGTP'] + ['WGTP' + str(j + 1) for j in range(80)]
+
+
+def rep_est(reptotals):
+    # reptotals: (subsets x 81) weight sums, column 0 is WGTP
+    reptotals = np.atleast_2d(np.asarray(reptotals, dtype = np.float64))
+    numpums = reptotals[:, 0]
+    rdatapums = np.square(reptotals[:, 1:] - numpums[:, None]).sum(axis = 1)
+
+    numpumsmoe = 1.645*(np.sqrt((4/80)*rdatapums))
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        numpumsmoep = (numpumsmoe/numpums)*100.0
+    numpumsu = numpums + numpumsmoe
+    numpumsl = numpums - numpumsmoe
+
+    return(numpums, numpumsmoe, numpumsmoep, numpumsu, numpumsl)
+
+
+def rep_totals(wgts, masks):
+    # wgts: (rows x 81) weight matrix, masks: (rows x subsets) boolean
+    # Returns (subsets x 81) weight sums from one matrix product
+    masks = np.asarray(masks)
+    if masks.ndim == 1:
+        masks = masks[:, None]
+    return masks.T.astype(np.float64) @ np.asarray(wgts, dtype = np.float64)
+
+
+def pums_est_matrix(wgts, masks):
+    # Totals, MoE, MoE (%), upper and lower bounds for every mask column
+    return rep_est(rep_totals(wgts, masks))
+
+
+def pums_est(datapums):
+    # Single-subset estimate from a filtered PUMS frame
+    reptotals = np.sum(datapums[WGTP_COLS].values, axis = 0)
+    return tuple(x[0] for x in rep_est(reptotals))
+
+
+def rep_ratios(numtotals, dentotals):
+    # Ratio of two (... x 81) replicate totals within each weight; N/A where
+    # the denominator is 0
+    numtotals = np.asarray(numtotals, dtype = np.float64)
+    dentotals = np.asarray(dentotals, dtype = np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.where(dentotals != 0, numtotals/dentotals, np.nan)
+
+
+def ratio_est(numtotals, dentotals):
+    # Ratio of two estimates (e.g. supply per unit of demand) with its MoE
+    # from the replicate ratios: the ratio is formed within each of the 81
+    # weights, then rep_est's formula applies to the ratios, so the
+    # covariance of numerator and denominator is accounted for.
+    # numtotals, dentotals: (subsets x 81) weight sums
+    return rep_est(rep_ratios(np.atleast_2d(numtotals), np.atleast_2d(dentotals)))
+
+
+def proportion_est(numtotals, dentotals):
+    # Share of each subset in its total (e.g. of all occupied units), in
+    # percent, with its MoE; ratio_est scaled by 100
+    return ratio_est(100.0*np.asarray(numtotals, dtype = np.float64), dentotals)
+
+
+def mean_est(values, wgts, masks):
+    # Weighted mean of values (one per row, N/A skipped) over each mask
+    # column: the ratio of the value total to the weight total
+    values = np.asarray(values, dtype = np.float64)
+    wgts = np.asarray(wgts, dtype = np.float64)*~np.isnan(values)[:, None]
+    return ratio_est(rep_totals(wgts*np.nan_to_num(values)[:, None], masks), rep_totals(wgts, masks))
+
+
+def rep_quantiles(values, wgts, masks, q = 0.5, groups = None):
+    # (groups x subsets x 81) weighted q-quantiles of values (one per row,
+    # N/A skipped), 0 < q <= 1: the first value, in sorted order, at which
+    # the cumulative weight reaches q of the total. Rows are sorted by group
+    # and value once; for each subset all groups and all 81 weights are
+    # then found with one cumulative sum and one binary search, the
+    # replicate columns being offset so they form one increasing array.
+    # groups: integer codes 0..G-1 (e.g. PUMA), None for a single group.
+    # Negative replicate weights count as 0. N/A where a subset has no
+    # weight in a group.
+    values = np.asarray(values, dtype = np.float64)
+    masks = np.asarray(masks, dtype = bool)
+    if masks.ndim == 1:
+        masks = masks[:, None]
+    groups = np.zeros(len(values), dtype = np.intp) if groups is None else np.asarray(groups)
+    ngroups = int(groups.max()) + 1 if len(groups) else 0
+
+    order = np.lexsort((values, groups))
+    order = order[~np.isnan(values[order])]
+    values = values[order]
+    groups = groups[order]
+    wgts = np.maximum(np.asarray(wgts, dtype = np.float64)[order], 0)
+    masks = masks[order]
+    nreps = wgts.shape[1]
+
+    quantiles = np.full((ngroups, masks.shape[1], nreps), np.nan)
+    for j in range(masks.shape[1]):
+        # The subset's rows stay sorted by group and value
+        rows = np.flatnonzero(masks[:, j])
+        if not len(rows):
+            continue
+        starts = np.searchsorted(groups[rows], np.arange(ngroups))
+        ends = np.searchsorted(groups[rows], np.arange(ngroups), side = 'right')
+        # Cumulative weight before each row, and through the last row
+        cumwgts = np.zeros((len(rows) + 1, nreps))
+        np.cumsum(wgts[rows], axis = 0, out = cumwgts[1:])
+        base = cumwgts[starts]
+        total = cumwgts[ends] - base
+        offsets = (cumwgts[-1].max() + 1)*np.arange(nreps)
+        found = np.searchsorted((cumwgts[1:] + offsets).T.ravel(), (base + q*total + offsets).T.ravel())
+        found = found.reshape(nreps, ngroups) - len(rows)*np.arange(nreps)[:, None]
+        found = np.minimum(found, ends - 1).clip(min = 0)
+        quantiles[:, j] = np.where(total > 0, values[rows][found].T, np.nan)
+    return quantiles
+
+
+def quantile_est(values, wgts, masks, q = 0.5):
+    # Weighted q-quantile (0.5 for the median) of values over each mask
+    # column with its MoE from the 81 replicate quantiles
+    return rep_est(rep_quantiles(values, wgts, masks, q)[0])
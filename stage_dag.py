@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy, memoized stage graph.
+
+A graph is a dict of stage name -> (function, dependency names, param).
+compute() runs a stage after its dependencies, depth first, and memoizes
+every result in a session dict, so asking for one output runs only the
+stages it needs and later requests in the same session reuse them. A stage
+registered with param = True takes a parameter (a table or cohort name) as
+its first argument and is memoized per parameter value. Stages may also call
+compute() themselves for dependencies that are only known at run time
+(e.g. the cohorts a table needs); with a run report, such a stage is timed
+nested in its caller (see profiling).
+
+    PIPELINE = {}
+
+    @add_stage(PIPELINE, 'hhpums')
+    def load(): ...
+
+    @add_stage(PIPELINE, 'cells', deps = ['hhpums'])
+    def cells(hhpums): ...
+
+    compute(PIPELINE, session, 'cells')
+"""
+
+
+from profiling import add_rows_in, stage
+
+
+def add_stage(graph, name, deps = (), param = False):
+    # Decorator registering a function as stage name of graph
+    def register(func):
+        graph[name] = (func, list(deps), param)
+        return func
+    return register
+
+
+def stage_key(name, param = None):
+    # Memo key of a stage result
+    return name if param is None else (name, param)
+
+
+def stage_rows(result):
+    # Row count of a stage result (of the first item of a tuple), None for
+    # results without rows
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    shape = getattr(result, 'shape', None)
+    if shape:
+        return shape[0]
+    return len(result) if isinstance(result, list) else None
+
+
+def compute(graph, memo, name, param = None, report = None):
+    # Result of stage name (for param), computing and memoizing it and its
+    # dependencies as needed; each computed stage is timed into report
+    # (see profiling) when one is given. Called from inside a stage, the
+    # result's rows count as going into that stage.
+    result = _compute(graph, memo, name, param, report)
+    if report is not None:
+        add_rows_in(report, stage_rows(result))
+    return result
+
+
+def _compute(graph, memo, name, param, report):
+    key = stage_key(name, param)
+    if key in memo:
+        return memo[key]
+    (func, deps, takes_param) = graph[name]
+    args = [_compute(graph, memo, dep, None, report) for dep in deps]
+    label = name if param is None else '%s[%s]' % (name, '%d items' % len(param) if isinstance(param, tuple) else param)
+    if report is None:
+        result = func(param, *args) if takes_param else func(*args)
+    else:
+        rows = [n for n in map(stage_rows, args) if n is not None]
+        with stage(report, label, rows_in = sum(rows) if rows else None) as counts:
+            result = func(param, *args) if takes_param else func(*args)
+            counts['rows_out'] = stage_rows(result)
+    memo[key] = result
+    return result
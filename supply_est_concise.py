@@ -34,6 +34,7 @@ PUMS fields:
         10 = boat, RB, van, etc.
     RNTP: Monthly rent amount
     GRNTP: Gross rent amount (bbbbb), monthly
+    GRPIP: Gross rent as a percentage of household income past 12 months (1-101)
     CONP (numeric)): Condo fee, monthly $$
     ELEFP (char): Electricity cost flag: 
             b = N/A, GQ vacant
@@ -65,6 +66,7 @@ PUMS fields:
         6: Nonfamily: Female householder living alone
         7: Female householder not living alone
     HINCP: Household Income (past 12 monthls): bbbbbbbb, includes loss options
+    ADJINC: Factor for adjusting income $ amounts (6 implied decimals)
     PARTNER: Unmarried partner households
         b: N/A (GQ/vacant)
         1: no unmarried partner in household
@@ -94,654 +96,526 @@ PUMS fields:
 """
 
 
-# import os
+import os
 # import sys
 import numpy as np
 import pandas as pd
+from cohort_spec import (DEMAND_COHORTS, DEMAND_NAME, HOMESHARE_COHORTS, HOMESHARE_NAME,
+                         HOUSEHOLDER_COHORTS, HOUSEHOLDER_NAME, HOUSING_DEMAND_COHORTS, INCOME_COHORTS, INCOME_NAME, TOTAL_COHORTS, TOTAL_NAME, cohort_levels, cohort_names, compile_cohorts, drop_dimension, spec_thresholds)
+from cube_cache import cube_key, derived_key, load_cube, save_cube
+from cube_engine import (cell_totals, cell_totals_chunked, cube_est, cube_frame, pairwise_frame, puma_cube,
+                         regroup_cube, stat_cube, tag_households)
+from income_band import ami_lookup, load_area_crosswalk, load_income_limits
+from output_writer import LONG_FORMATS, finish_writes, long_frame, ratio_frame, start_writer, write_async
+from person_join import householder_features, join_householder
+from profiling import new_report, stage, write_report
+from pums_load import hh_columns, iter_hhpums, load_hhpums_cached
+from replicate_est import WGTP_COLS
+from stage_dag import add_stage, compute
+from threshold_sweep import sweep_frame, threshold_sweep
+from tract_alloc import allocate_cube, allocation_matrix, load_crosswalk
 # from matplotlib import pyplot as plt
 # import seaborn as sns
 
+# Importing this module only sets up the configuration and the pipeline
+# stages below; nothing is read or computed until an output is asked for:
+#     import supply_est_concise as supply
+#     supply.get('table', '65plus')          # one table, only its cohorts
+#     supply.write_outputs(['pumas_65plus'])
+#     supply.get('supply_long')              # every cohort, long format
+# Settings below (files, cohort_specs, match_pairs, ...) are read when a
+# stage first needs them, so they can be set after import:
+#     supply.ma_pfile = 'psam_p25.csv'       # adds the householder cohorts
+# Results are memoized for the session, so later requests reuse them
+# (clear pipeline_session after changing a setting). Run as a script to
+# write every output.
+
+# Run instrumentation: wall/CPU time, peak memory and rows in and out of
+# each stage (see profiling). Set profile_run for a diagnostic run that also
+# traces per-stage allocations and writes a cProfile .prof.
+profile_run = False
+
 # PUMS analysis
 ma_hhfile = "K:\\DataServices\\Datasets\\U.S. Census and Demographics\\PUMS\\Raw\\pums_2014_18\\csv_hma\\psam_h25.csv"
-ma_hhpums = pd.read_csv(ma_hhfile, low_memory = False)
-
 ma_pumafile = "K:\\DataServices\\Projects\\Current_projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\justpumas.csv"
-ma_pumas = pd.read_csv(ma_pumafile, low_memory = False)
-ma_pumas = ma_pumas[['puma5', 'puma_name']]
-
-ma_hhpums = ma_hhpums.join(ma_pumas.set_index('puma5'), on='PUMA')
-
-# Select only one or two person households
-ma_housingu = ma_hhpums.loc[ma_hhpums['TYPE'] == 1]
-# Sub-select OWNED housing units only (new as of )
-ma_ownedunit = ma_housingu.loc[ma_housingu['TEN'].isin([1,2])]
-# One person households
-ma_onepersonhh = ma_ownedunit.loc[ma_ownedunit['NP'] == 1]
-# Two bedrooms (one extra)
-ma_onepersonhh_2br = ma_onepersonhh.loc[~ma_onepersonhh['BDSP'].isin(['bb',1.0])]
-ma_onep_2br_o60 = ma_onepersonhh_2br.loc[ma_onepersonhh_2br['R60'] == 1]
-ma_onep_2br_o65 = ma_onepersonhh_2br.loc[ma_onepersonhh_2br['R65'] == 1]
-# Cost-burdened (30%)
-ma_onep_2br_o60_cb30 = ma_onep_2br_o60.loc[ma_onep_2br_o60['OCPIP'] >= 30.0]
-ma_onep_2br_o65_cb30 = ma_onep_2br_o65.loc[ma_onep_2br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_onep_2br_o60_cb50 = ma_onep_2br_o60.loc[ma_onep_2br_o60['OCPIP'] >= 50.0]
-ma_onep_2br_o65_cb50 = ma_onep_2br_o65.loc[ma_onep_2br_o65['OCPIP'] >= 50.0]
-# 3 bedrooms (2 extra)
-ma_onepersonhh_3br = ma_onepersonhh.loc[~ma_onepersonhh['BDSP'].isin(['bb',1.0, 2.0])]
-ma_onep_3br_o60 = ma_onepersonhh_3br.loc[ma_onepersonhh_3br['R60'] == 1]
-ma_onep_3br_o65 = ma_onepersonhh_3br.loc[ma_onepersonhh_3br['R65'] == 1]
-# Cost-burdened (30%)
-ma_onep_3br_o60_cb30 = ma_onep_3br_o60.loc[ma_onep_3br_o60['OCPIP'] >= 30.0]
-ma_onep_3br_o65_cb30 = ma_onep_3br_o65.loc[ma_onep_3br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_onep_3br_o60_cb50 = ma_onep_3br_o60.loc[ma_onep_3br_o60['OCPIP'] >= 50.0]
-ma_onep_3br_o65_cb50 = ma_onep_3br_o65.loc[ma_onep_3br_o65['OCPIP'] >= 50.0]
-
-# Two person couple households
-ma_twopersonhh = ma_ownedunit.loc[ma_ownedunit['NP'] == 2]
-ma_twopersonhh = ma_twopersonhh.loc[(ma_twopersonhh['PARTNER'].isin([2.0, 3.0, 4.0, 5.0]) | ma_twopersonhh['HHT'] == 1.0) | ma_twopersonhh['SSMC'].isin([1.0,2.0])]
-# Two bedrooms (one extra)
-ma_twopersonhh_2br = ma_twopersonhh.loc[~ma_twopersonhh['BDSP'].isin(['bb',1.0])]
-ma_twop_2br_o60 = ma_twopersonhh_2br.loc[ma_twopersonhh_2br['R60'] == 2]
-ma_twop_2br_o65 = ma_twopersonhh_2br.loc[ma_twopersonhh_2br['R65'] == 2]
-# Cost-burdened (30%)
-ma_twop_2br_o60_cb30 = ma_twop_2br_o60.loc[ma_twop_2br_o60['OCPIP'] >= 30.0]
-ma_twop_2br_o65_cb30 = ma_twop_2br_o65.loc[ma_twop_2br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_twop_2br_o60_cb50 = ma_twop_2br_o60.loc[ma_twop_2br_o60['OCPIP'] >= 50.0]
-ma_twop_2br_o65_cb50 = ma_twop_2br_o65.loc[ma_twop_2br_o65['OCPIP'] >= 50.0]
-# 3 bedrooms (2 extra)
-ma_twopersonhh_3br = ma_twopersonhh.loc[~ma_twopersonhh['BDSP'].isin(['bb',1.0, 2.0])]
-ma_twop_3br_o60 = ma_twopersonhh_3br.loc[ma_twopersonhh_3br['R60'] == 2]
-ma_twop_3br_o65 = ma_twopersonhh_3br.loc[ma_twopersonhh_3br['R65'] == 2]
-# Cost-burdened (30%)
-ma_twop_3br_o60_cb30 = ma_twop_3br_o60.loc[ma_twop_3br_o60['OCPIP'] >= 30.0]
-ma_twop_3br_o65_cb30 = ma_twop_3br_o65.loc[ma_twop_3br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_twop_3br_o60_cb50 = ma_twop_3br_o60.loc[ma_twop_3br_o60['OCPIP'] >= 50.0]
-ma_twop_3br_o65_cb50 = ma_twop_3br_o65.loc[ma_twop_3br_o65['OCPIP'] >= 50.0]
-
-
-# single-person AND Two person couple households
-ma_1or2phh = ma_twopersonhh.append(ma_onepersonhh, ignore_index=True)
-# Two bedrooms (one extra)
-ma_1or2phh_2br = ma_1or2phh.loc[~ma_1or2phh['BDSP'].isin(['bb',1.0])]
-ma_1or2p_2br_o60 = ma_1or2phh_2br.loc[ma_1or2phh_2br['R60'] == 2]
-ma_1or2p_2br_o65 = ma_1or2phh_2br.loc[ma_1or2phh_2br['R65'] == 2]
-# Cost-burdened (30%)
-ma_1or2p_2br_o60_cb30 = ma_1or2p_2br_o60.loc[ma_1or2p_2br_o60['OCPIP'] >= 30.0]
-ma_1or2p_2br_o65_cb30 = ma_1or2p_2br_o65.loc[ma_1or2p_2br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_1or2p_2br_o60_cb50 = ma_1or2p_2br_o60.loc[ma_1or2p_2br_o60['OCPIP'] >= 50.0]
-ma_1or2p_2br_o65_cb50 = ma_1or2p_2br_o65.loc[ma_1or2p_2br_o65['OCPIP'] >= 50.0]
-# 3 bedrooms (2 extra)
-ma_1or2phh_3br = ma_1or2phh.loc[~ma_1or2phh['BDSP'].isin(['bb',1.0, 2.0])]
-ma_1or2p_3br_o60 = ma_1or2phh_3br.loc[ma_1or2phh_3br['R60'] == 2]
-ma_1or2p_3br_o65 = ma_1or2phh_3br.loc[ma_1or2phh_3br['R65'] == 2]
-# Cost-burdened (30%)
-ma_1or2p_3br_o60_cb30 = ma_1or2p_3br_o60.loc[ma_1or2p_3br_o60['OCPIP'] >= 30.0]
-ma_1or2p_3br_o65_cb30 = ma_1or2p_3br_o65.loc[ma_1or2p_3br_o65['OCPIP'] >= 30.0]
-# Cost-burdened (50%)
-ma_1or2p_3br_o60_cb50 = ma_1or2p_3br_o60.loc[ma_1or2p_3br_o60['OCPIP'] >= 50.0]
-ma_1or2p_3br_o65_cb50 = ma_1or2p_3br_o65.loc[ma_1or2p_3br_o65['OCPIP'] >= 50.0]
 
+# Person file (psam_p25.csv): set to add householder age and employment
+# cohorts (see person_join). None uses the household R60/R65 flags only.
+ma_pfile = None
+
+# Area median income bands: set both to a local HUD income limits csv (by
+# county) and a Geocorr PUMA -> county file to add the homeshare cohorts at
+# or under 30/50/80% AMI (see income_band)
+ami_limitsfile = None
+ami_xwalkfile = None
+
+# Cohort specs to estimate, as (spec, name) pairs (see cohort_spec); None
+# for default_specs(), which follow the person and AMI files set above
+cohort_specs = None
+
+# Local cache for the parsed PUMS snapshot and replicate cubes; None turns
+# both off
+pums_cachedir = os.path.join(os.path.expanduser('~'), '.pums_cache')
+# Set to a row count (e.g. 500000) to stream files larger than memory in chunks
+pums_chunksize = None
+
+# Replicate-based statistics of housing values for every PUMA and cohort:
+# (column, statistic), statistic 'mean' or a quantile (0.5 for the median),
+# e.g. [('OCPIP', 0.5), ('GRPIP', 0.5)]. Each is one more scan of the
+# housing rows (cached with the replicate cube).
+value_stats = []
 
 # Estimate number by PUMA
-PUMAs_ma = ma_hhpums['PUMA'].unique()
 PUMAs_study = [3301, 3303, 3302, 3305, 3304, 506, 507]
 
-hhs_all = np.empty(len(PUMAs_study))
-hh1p60o_2r = np.empty(len(PUMAs_study))
-hh1p60o_3r = np.empty(len(PUMAs_study))
-hh2p60o_2r = np.empty(len(PUMAs_study))
-hh2p60o_3r = np.empty(len(PUMAs_study))
-hh12p60o_2r = np.empty(len(PUMAs_study))
-hh12p60o_3r = np.empty(len(PUMAs_study))
-hh1p65o_2r = np.empty(len(PUMAs_study))
-hh1p65o_3r = np.empty(len(PUMAs_study))
-hh2p65o_2r = np.empty(len(PUMAs_study))
-hh2p65o_3r = np.empty(len(PUMAs_study))
-hh12p65o_2r = np.empty(len(PUMAs_study))
-hh12p65o_3r = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb30 = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb30 = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb30 = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb30 = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb30 = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb30 = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb30 = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb30 = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb30 = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb30 = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb30 = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb30 = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb50 = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb50 = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb50 = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb50 = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb50 = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb50 = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb50 = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb50 = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb50 = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb50 = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb50 = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb50 = np.empty(len(PUMAs_study))
-
-hhs_allmoe = np.empty(len(PUMAs_study))
-hh1p60o_2rmoe = np.empty(len(PUMAs_study))
-hh1p60o_3rmoe = np.empty(len(PUMAs_study))
-hh2p60o_2rmoe = np.empty(len(PUMAs_study))
-hh2p60o_3rmoe = np.empty(len(PUMAs_study))
-hh12p60o_2rmoe = np.empty(len(PUMAs_study))
-hh12p60o_3rmoe = np.empty(len(PUMAs_study))
-hh1p65o_2rmoe = np.empty(len(PUMAs_study))
-hh1p65o_3rmoe = np.empty(len(PUMAs_study))
-hh2p65o_2rmoe = np.empty(len(PUMAs_study))
-hh2p65o_3rmoe = np.empty(len(PUMAs_study))
-hh12p65o_2rmoe = np.empty(len(PUMAs_study))
-hh12p65o_3rmoe = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb30moe = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb30moe = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb50moe = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb50moe = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb50moe = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb50moe = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb50moe = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb50moe = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb50moe = np.empty(len(PUMAs_study))
-
-hhs_allmoep = np.empty(len(PUMAs_study))
-hh1p60o_2rmoep = np.empty(len(PUMAs_study))
-hh1p60o_3rmoep = np.empty(len(PUMAs_study))
-hh2p60o_2rmoep = np.empty(len(PUMAs_study))
-hh2p60o_3rmoep = np.empty(len(PUMAs_study))
-hh12p60o_2rmoep = np.empty(len(PUMAs_study))
-hh12p60o_3rmoep = np.empty(len(PUMAs_study))
-hh1p65o_2rmoep = np.empty(len(PUMAs_study))
-hh1p65o_3rmoep = np.empty(len(PUMAs_study))
-hh2p65o_2rmoep = np.empty(len(PUMAs_study))
-hh2p65o_3rmoep = np.empty(len(PUMAs_study))
-hh12p65o_2rmoep = np.empty(len(PUMAs_study))
-hh12p65o_3rmoep = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb30moep = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb30moep = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb50moep = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb50moep = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb50moep = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb50moep = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb50moep = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb50moep = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb50moep = np.empty(len(PUMAs_study))
-
-hhs_allu = np.empty(len(PUMAs_study))
-hh1p60o_2ru = np.empty(len(PUMAs_study))
-hh1p60o_3ru = np.empty(len(PUMAs_study))
-hh2p60o_2ru = np.empty(len(PUMAs_study))
-hh2p60o_3ru = np.empty(len(PUMAs_study))
-hh12p60o_2ru = np.empty(len(PUMAs_study))
-hh12p60o_3ru = np.empty(len(PUMAs_study))
-hh1p65o_2ru = np.empty(len(PUMAs_study))
-hh1p65o_3ru = np.empty(len(PUMAs_study))
-hh2p65o_2ru = np.empty(len(PUMAs_study))
-hh2p65o_3ru = np.empty(len(PUMAs_study))
-hh12p65o_2ru = np.empty(len(PUMAs_study))
-hh12p65o_3ru = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb30u = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb30u = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb30u = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb30u = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb30u = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb30u = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb30u = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb30u = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb30u = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb30u = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb30u = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb30u = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb50u = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb50u = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb50u = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb50u = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb50u = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb50u = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb50u = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb50u = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb50u = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb50u = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb50u = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb50u = np.empty(len(PUMAs_study))
-
-hhs_alll = np.empty(len(PUMAs_study))
-hh1p60o_2rl = np.empty(len(PUMAs_study))
-hh1p60o_3rl = np.empty(len(PUMAs_study))
-hh2p60o_2rl = np.empty(len(PUMAs_study))
-hh2p60o_3rl = np.empty(len(PUMAs_study))
-hh12p60o_2rl = np.empty(len(PUMAs_study))
-hh12p60o_3rl = np.empty(len(PUMAs_study))
-hh1p65o_2rl = np.empty(len(PUMAs_study))
-hh1p65o_3rl = np.empty(len(PUMAs_study))
-hh2p65o_2rl = np.empty(len(PUMAs_study))
-hh2p65o_3rl = np.empty(len(PUMAs_study))
-hh12p65o_2rl = np.empty(len(PUMAs_study))
-hh12p65o_3rl = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb30l = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb30l = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb30l = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb30l = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb30l = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb30l = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb30l = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb30l = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb30l = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb30l = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb30l = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb30l = np.empty(len(PUMAs_study))
-hh1p60o_2r_cb50l = np.empty(len(PUMAs_study))
-hh1p60o_3r_cb50l = np.empty(len(PUMAs_study))
-hh2p60o_2r_cb50l = np.empty(len(PUMAs_study))
-hh2p60o_3r_cb50l = np.empty(len(PUMAs_study))
-hh12p60o_2r_cb50l = np.empty(len(PUMAs_study))
-hh12p60o_3r_cb50l = np.empty(len(PUMAs_study))
-hh1p65o_2r_cb50l = np.empty(len(PUMAs_study))
-hh1p65o_3r_cb50l = np.empty(len(PUMAs_study))
-hh2p65o_2r_cb50l = np.empty(len(PUMAs_study))
-hh2p65o_3r_cb50l = np.empty(len(PUMAs_study))
-hh12p65o_2r_cb50l = np.empty(len(PUMAs_study))
-hh12p65o_3r_cb50l = np.empty(len(PUMAs_study))
-
-def pums_est(datapums):
-    # datapums = data.loc[data['PUMA'] == PUMAs_ma[k]]
-    numpums = np.sum(datapums['WGTP'].values)
-    rdatapums = list()
-    for j in range(80):
-        fieldname = 'WGTP' + str(j + 1)
-        
-        numpumstemp = (np.sum(datapums[fieldname].values))
-        rdatapums.append(np.square(numpumstemp - numpums))
-        
-    numpumsmoe = 1.645*(np.sqrt((4/80)*np.sum(rdatapums)))
-    numpumsmoep = (numpumsmoe/float(numpums))*100.0
-    numpumsu = numpums + numpumsmoe
-    numpumsl = numpums - numpumsmoe
-
-    return(numpums, numpumsmoe, numpumsmoep, numpumsu, numpumsl)
-
-pumanum = list()
-moe = list()
-pumanames = list()
-
-
-
-for k in range(len(PUMAs_study)):
-
-    hhs_allpums = ma_hhpums.loc[ma_hhpums['PUMA'] == PUMAs_study[k]]
-    hh1p60o_2rpums = ma_onep_2br_o60.loc[ma_onep_2br_o60['PUMA'] == PUMAs_study[k]]
-    hh1p60o_3rpums = ma_onep_3br_o60.loc[ma_onep_3br_o60['PUMA'] == PUMAs_study[k]]
-    hh2p60o_2rpums = ma_twop_2br_o60.loc[ma_twop_2br_o60['PUMA'] == PUMAs_study[k]]
-    hh2p60o_3rpums = ma_twop_3br_o60.loc[ma_twop_3br_o60['PUMA'] == PUMAs_study[k]]
-    hh12p60o_2rpums = ma_twop_2br_o60.loc[ma_twop_2br_o60['PUMA'] == PUMAs_study[k]]
-    hh12p60o_3rpums = ma_twop_3br_o60.loc[ma_twop_3br_o60['PUMA'] == PUMAs_study[k]]
-    hh1p65o_2rpums = ma_onep_2br_o65.loc[ma_onep_2br_o65['PUMA'] == PUMAs_study[k]]
-    hh1p65o_3rpums = ma_onep_3br_o65.loc[ma_onep_3br_o65['PUMA'] == PUMAs_study[k]]
-    hh2p65o_2rpums = ma_twop_2br_o65.loc[ma_twop_2br_o65['PUMA'] == PUMAs_study[k]]
-    hh2p65o_3rpums = ma_twop_3br_o65.loc[ma_twop_3br_o65['PUMA'] == PUMAs_study[k]]
-    hh12p65o_2rpums = ma_twop_2br_o65.loc[ma_twop_2br_o65['PUMA'] == PUMAs_study[k]]
-    hh12p65o_3rpums = ma_twop_3br_o65.loc[ma_twop_3br_o65['PUMA'] == PUMAs_study[k]]
-    pumanames.append(hh1p60o_2rpums['puma_name'].values[0])
-    
-    hh1p60o_2rpums_cb30 = ma_onep_2br_o60_cb30.loc[ma_onep_2br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh1p60o_3rpums_cb30 = ma_onep_3br_o60_cb30.loc[ma_onep_3br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh2p60o_2rpums_cb30 = ma_twop_2br_o60_cb30.loc[ma_twop_2br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh2p60o_3rpums_cb30 = ma_twop_3br_o60_cb30.loc[ma_twop_3br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh12p60o_2rpums_cb30 = ma_twop_2br_o60_cb30.loc[ma_twop_2br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh12p60o_3rpums_cb30 = ma_twop_3br_o60_cb30.loc[ma_twop_3br_o60_cb30['PUMA'] == PUMAs_study[k]]
-    hh1p65o_2rpums_cb30 = ma_onep_2br_o65_cb30.loc[ma_onep_2br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    hh1p65o_3rpums_cb30 = ma_onep_3br_o65_cb30.loc[ma_onep_3br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    hh2p65o_2rpums_cb30 = ma_twop_2br_o65_cb30.loc[ma_twop_2br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    hh2p65o_3rpums_cb30 = ma_twop_3br_o65_cb30.loc[ma_twop_3br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    hh12p65o_2rpums_cb30 = ma_twop_2br_o65_cb30.loc[ma_twop_2br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    hh12p65o_3rpums_cb30 = ma_twop_3br_o65_cb30.loc[ma_twop_3br_o65_cb30['PUMA'] == PUMAs_study[k]]
-    
-    hh1p60o_2rpums_cb50 = ma_onep_2br_o60_cb50.loc[ma_onep_2br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh1p60o_3rpums_cb50 = ma_onep_3br_o60_cb50.loc[ma_onep_3br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh2p60o_2rpums_cb50 = ma_twop_2br_o60_cb50.loc[ma_twop_2br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh2p60o_3rpums_cb50 = ma_twop_3br_o60_cb50.loc[ma_twop_3br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh12p60o_2rpums_cb50 = ma_twop_2br_o60_cb50.loc[ma_twop_2br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh12p60o_3rpums_cb50 = ma_twop_3br_o60_cb50.loc[ma_twop_3br_o60_cb50['PUMA'] == PUMAs_study[k]]
-    hh1p65o_2rpums_cb50 = ma_onep_2br_o65_cb50.loc[ma_onep_2br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    hh1p65o_3rpums_cb50 = ma_onep_3br_o65_cb50.loc[ma_onep_3br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    hh2p65o_2rpums_cb50 = ma_twop_2br_o65_cb50.loc[ma_twop_2br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    hh2p65o_3rpums_cb50 = ma_twop_3br_o65_cb50.loc[ma_twop_3br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    hh12p65o_2rpums_cb50 = ma_twop_2br_o65_cb50.loc[ma_twop_2br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    hh12p65o_3rpums_cb50 = ma_twop_3br_o65_cb50.loc[ma_twop_3br_o65_cb50['PUMA'] == PUMAs_study[k]]
-    
-    (hhs_all[k], hhs_allmoe[k], hhs_allmoep[k], hhs_allu[k], hhs_alll[k]) = pums_est(hhs_allpums)
-    (hh1p60o_2r[k], hh1p60o_2rmoe[k], hh1p60o_2rmoep[k], hh1p60o_2ru[k], hh1p60o_2rl[k]) = pums_est(hh1p60o_2rpums)
-    (hh1p60o_3r[k], hh1p60o_3rmoe[k], hh1p60o_3rmoep[k], hh1p60o_3ru[k], hh1p60o_3rl[k]) = pums_est(hh1p60o_3rpums)
-    (hh2p60o_2r[k], hh2p60o_2rmoe[k], hh2p60o_2rmoep[k], hh2p60o_2ru[k], hh2p60o_2rl[k]) = pums_est(hh2p60o_2rpums)
-    (hh2p60o_3r[k], hh2p60o_3rmoe[k], hh2p60o_3rmoep[k], hh2p60o_3ru[k], hh2p60o_3rl[k]) = pums_est(hh2p60o_3rpums)
-    (hh12p60o_2r[k], hh12p60o_2rmoe[k], hh12p60o_2rmoep[k], hh12p60o_2ru[k], hh12p60o_2rl[k]) = pums_est(hh12p60o_2rpums)
-    (hh12p60o_3r[k], hh12p60o_3rmoe[k], hh12p60o_3rmoep[k], hh12p60o_3ru[k], hh12p60o_3rl[k]) = pums_est(hh12p60o_3rpums)
-    (hh1p65o_2r[k], hh1p65o_2rmoe[k], hh1p65o_2rmoep[k], hh1p65o_2ru[k], hh1p65o_2rl[k]) = pums_est(hh1p65o_2rpums)
-    (hh1p65o_3r[k], hh1p65o_3rmoe[k], hh1p65o_3rmoep[k], hh1p65o_3ru[k], hh1p65o_3rl[k]) = pums_est(hh1p65o_3rpums)
-    (hh2p65o_2r[k], hh2p65o_2rmoe[k], hh2p65o_2rmoep[k], hh2p65o_2ru[k], hh2p65o_2rl[k]) = pums_est(hh2p65o_2rpums)
-    (hh2p65o_3r[k], hh2p65o_3rmoe[k], hh2p65o_3rmoep[k], hh2p65o_3ru[k], hh2p65o_3rl[k]) = pums_est(hh2p65o_3rpums)
-    (hh12p65o_2r[k], hh12p65o_2rmoe[k], hh12p65o_2rmoep[k], hh12p65o_2ru[k], hh12p65o_2rl[k]) = pums_est(hh12p65o_2rpums)
-    (hh12p65o_3r[k], hh12p65o_3rmoe[k], hh12p65o_3rmoep[k], hh12p65o_3ru[k], hh12p65o_3rl[k]) = pums_est(hh12p65o_3rpums)
-    
-    (hh1p60o_2r_cb30[k], hh1p60o_2r_cb30moe[k], hh1p60o_2r_cb30moep[k], hh1p60o_2r_cb30u[k], hh1p60o_2r_cb30l[k]) = pums_est(hh1p60o_2rpums_cb30)
-    (hh1p60o_3r_cb30[k], hh1p60o_3r_cb30moe[k], hh1p60o_3r_cb30moep[k], hh1p60o_3r_cb30u[k], hh1p60o_3r_cb30l[k]) = pums_est(hh1p60o_3rpums_cb30)
-    (hh2p60o_2r_cb30[k], hh2p60o_2r_cb30moe[k], hh2p60o_2r_cb30moep[k], hh2p60o_2r_cb30u[k], hh2p60o_2r_cb30l[k]) = pums_est(hh2p60o_2rpums_cb30)
-    (hh2p60o_3r_cb30[k], hh2p60o_3r_cb30moe[k], hh2p60o_3r_cb30moep[k], hh2p60o_3r_cb30u[k], hh2p60o_3r_cb30l[k]) = pums_est(hh2p60o_3rpums_cb30)
-    (hh12p60o_2r_cb30[k], hh12p60o_2r_cb30moe[k], hh12p60o_2r_cb30moep[k], hh12p60o_2r_cb30u[k], hh12p60o_2r_cb30l[k]) = pums_est(hh12p60o_2rpums_cb30)
-    (hh12p60o_3r_cb30[k], hh12p60o_3r_cb30moe[k], hh12p60o_3r_cb30moep[k], hh12p60o_3r_cb30u[k], hh12p60o_3r_cb30l[k]) = pums_est(hh12p60o_3rpums_cb30)
-    (hh1p65o_2r_cb30[k], hh1p65o_2r_cb30moe[k], hh1p65o_2r_cb30moep[k], hh1p65o_2r_cb30u[k], hh1p65o_2r_cb30l[k]) = pums_est(hh1p65o_2rpums_cb30)
-    (hh1p65o_3r_cb30[k], hh1p65o_3r_cb30moe[k], hh1p65o_3r_cb30moep[k], hh1p65o_3r_cb30u[k], hh1p65o_3r_cb30l[k]) = pums_est(hh1p65o_3rpums_cb30)
-    (hh2p65o_2r_cb30[k], hh2p65o_2r_cb30moe[k], hh2p65o_2r_cb30moep[k], hh2p65o_2r_cb30u[k], hh2p65o_2r_cb30l[k]) = pums_est(hh2p65o_2rpums_cb30)
-    (hh2p65o_3r_cb30[k], hh2p65o_3r_cb30moe[k], hh2p65o_3r_cb30moep[k], hh2p65o_3r_cb30u[k], hh2p65o_3r_cb30l[k]) = pums_est(hh2p65o_3rpums_cb30)
-    (hh12p65o_2r_cb30[k], hh12p65o_2r_cb30moe[k], hh12p65o_2r_cb30moep[k], hh12p65o_2r_cb30u[k], hh12p65o_2r_cb30l[k]) = pums_est(hh12p65o_2rpums_cb30)
-    (hh12p65o_3r_cb30[k], hh12p65o_3r_cb30moe[k], hh12p65o_3r_cb30moep[k], hh12p65o_3r_cb30u[k], hh12p65o_3r_cb30l[k]) = pums_est(hh12p65o_3rpums_cb30)
-    
-    (hh1p60o_2r_cb50[k], hh1p60o_2r_cb50moe[k], hh1p60o_2r_cb50moep[k], hh1p60o_2r_cb50u[k], hh1p60o_2r_cb50l[k]) = pums_est(hh1p60o_2rpums_cb50)
-    (hh1p60o_3r_cb50[k], hh1p60o_3r_cb50moe[k], hh1p60o_3r_cb50moep[k], hh1p60o_3r_cb50u[k], hh1p60o_3r_cb50l[k]) = pums_est(hh1p60o_3rpums_cb50)
-    (hh2p60o_2r_cb50[k], hh2p60o_2r_cb50moe[k], hh2p60o_2r_cb50moep[k], hh2p60o_2r_cb50u[k], hh2p60o_2r_cb50l[k]) = pums_est(hh2p60o_2rpums_cb50)
-    (hh2p60o_3r_cb50[k], hh2p60o_3r_cb50moe[k], hh2p60o_3r_cb50moep[k], hh2p60o_3r_cb50u[k], hh2p60o_3r_cb50l[k]) = pums_est(hh2p60o_3rpums_cb50)
-    (hh12p60o_2r_cb50[k], hh12p60o_2r_cb50moe[k], hh12p60o_2r_cb50moep[k], hh12p60o_2r_cb50u[k], hh12p60o_2r_cb50l[k]) = pums_est(hh12p60o_2rpums_cb50)
-    (hh12p60o_3r_cb50[k], hh12p60o_3r_cb50moe[k], hh12p60o_3r_cb50moep[k], hh12p60o_3r_cb50u[k], hh12p60o_3r_cb50l[k]) = pums_est(hh12p60o_3rpums_cb50)
-    (hh1p65o_2r_cb50[k], hh1p65o_2r_cb50moe[k], hh1p65o_2r_cb50moep[k], hh1p65o_2r_cb50u[k], hh1p65o_2r_cb50l[k]) = pums_est(hh1p65o_2rpums_cb50)
-    (hh1p65o_3r_cb50[k], hh1p65o_3r_cb50moe[k], hh1p65o_3r_cb50moep[k], hh1p65o_3r_cb50u[k], hh1p65o_3r_cb50l[k]) = pums_est(hh1p65o_3rpums_cb50)
-    (hh2p65o_2r_cb50[k], hh2p65o_2r_cb50moe[k], hh2p65o_2r_cb50moep[k], hh2p65o_2r_cb50u[k], hh2p65o_2r_cb50l[k]) = pums_est(hh2p65o_2rpums_cb50)
-    (hh2p65o_3r_cb50[k], hh2p65o_3r_cb50moe[k], hh2p65o_3r_cb50moep[k], hh2p65o_3r_cb50u[k], hh2p65o_3r_cb50l[k]) = pums_est(hh2p65o_3rpums_cb50)
-    (hh12p65o_2r_cb50[k], hh12p65o_2r_cb50moe[k], hh12p65o_2r_cb50moep[k], hh12p65o_2r_cb50u[k], hh12p65o_2r_cb50l[k]) = pums_est(hh12p65o_2rpums_cb50)
-    (hh12p65o_3r_cb50[k], hh12p65o_3r_cb50moe[k], hh12p65o_3r_cb50moep[k], hh12p65o_3r_cb50u[k], hh12p65o_3r_cb50l[k]) = pums_est(hh12p65o_3rpums_cb50)
-    
-    
-    
-    
-supplypuma_single60plus = {'PUMA': PUMAs_study,
-                           'PUMA Name': pumanames,
-                           'All occupied housing units': hhs_all,
-                           'All occupied housing units MoE': hhs_allmoe,
-                           'All occupied housing units MoE (%)': hhs_allmoep,
-                           'All occupied housing units (Lower)': hhs_alll,
-                           'All occupied housing units (Upper)': hhs_allu,
-                           'At least one extra bedroom': hh1p60o_2r,
-                           'At least one extra bedroom MoE': hh1p60o_2rmoe,
-                           'At least one extra bedroom MoE (%)': hh1p60o_2rmoep,
-                           'At least one extra bedroom (Lower)': hh1p60o_2rl,
-                           'At least one extra bedroom (Upper)': hh1p60o_2ru,
-                           'At least two extra bedrooms': hh1p60o_3r,
-                           'At least two extra bedrooms MoE': hh1p60o_3rmoe,
-                           'At least two extra bedrooms MoE (%)': hh1p60o_3rmoep,
-                           'At least two extra bedrooms (Lower)': hh1p60o_3rl,
-                           'At least two extra bedrooms (Upper)': hh1p60o_3ru,
-                           'Cost-burdened (30%) with at least one extra bedroom': hh1p60o_2r_cb30,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE': hh1p60o_2r_cb30moe,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh1p60o_2r_cb30moep,
-                           'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh1p60o_2r_cb30l,
-                           'Cost-burdened (30%) with at least one extra bedroom (Upper)': hh1p60o_2r_cb30u,
-                           'Cost-burdened (30%) with at least two extra bedrooms': hh1p60o_3r_cb30,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE': hh1p60o_3r_cb30moe,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh1p60o_3r_cb30moep,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh1p60o_3r_cb30l,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Upper)': hh1p60o_3r_cb30u,
-                           'Cost-burdened (50%) with at least one extra bedroom': hh1p60o_2r_cb50,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE': hh1p60o_2r_cb50moe,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh1p60o_2r_cb50moep,
-                           'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh1p60o_2r_cb50l,
-                           'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh1p60o_2r_cb50u,
-                           'Cost-burdened (50%) with at least two extra bedrooms': hh1p60o_3r_cb50,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE': hh1p60o_3r_cb50moe,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh1p60o_3r_cb50moep,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh1p60o_3r_cb50l,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh1p60o_3r_cb50u}
-                              
-supplypuma_couple60plus = {'PUMA': PUMAs_study,
-                           'PUMA Name': pumanames,
-                           'All occupied housing units': hhs_all,
-                           'All occupied housing units MoE': hhs_allmoe,
-                           'All occupied housing units MoE (%)': hhs_allmoep,
-                           'All occupied housing units (Lower)': hhs_alll,
-                           'All occupied housing units (Upper)': hhs_allu,                            
-                           'At least one extra bedroom': hh2p60o_2r,
-                           'At least one extra bedroom MoE': hh2p60o_2rmoe,
-                           'At least one extra bedroom MoE (%)': hh2p60o_2rmoep,
-                           'At least one extra bedroom (Lower)': hh2p60o_2rl,
-                           'At least one extra bedroom (Upper)': hh2p60o_2ru,
-                           'At least two extra bedrooms': hh2p60o_3r,
-                           'At least one extra bedroom MoE': hh2p60o_2rmoe,
-                           'At least two extra bedrooms MoE (%)': hh2p60o_3rmoep,
-                           'At least two extra bedrooms (Lower)': hh2p60o_3rl,
-                           'At least two extra bedrooms (Upper)': hh2p60o_3ru,
-                           'Cost-burdened (30%) with at least one extra bedroom': hh2p60o_2r_cb30,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE': hh2p60o_2r_cb30moe,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh2p60o_2r_cb30moep,
-                           'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh2p60o_2r_cb30l,
-                           'Cost-burdened (30%) 60 with at least one extra bedroom (Upper)': hh2p60o_2r_cb30u,
-                           'Cost-burdened (30%) with at least two extra bedrooms': hh2p60o_3r_cb30,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE': hh2p60o_3r_cb30moe,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh2p60o_3r_cb30moep,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh2p60o_3r_cb30l,
-                           'Cost-burdened (30%) 60 with at least two extra bedrooms (Upper)': hh2p60o_3r_cb30u,
-                           'Cost-burdened (50%) with at least one extra bedroom': hh2p60o_2r_cb50,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE': hh2p60o_2r_cb50moe,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh2p60o_2r_cb50moep,
-                           'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh2p60o_2r_cb50l,
-                           'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh2p60o_2r_cb50u,
-                           'Cost-burdened (50%) with at least two extra bedrooms': hh2p60o_3r_cb50,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE': hh2p60o_3r_cb50moe,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh2p60o_3r_cb50moep,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh2p60o_3r_cb50l,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh2p60o_3r_cb50u}
-
-supplypuma_60plus = {'PUMA': PUMAs_study,
-                     'PUMA Name': pumanames,
-                     'All occupied housing units': hhs_all,
-                     'All occupied housing units MoE': hhs_allmoe,
-                     'All occupied housing units MoE (%)': hhs_allmoep,
-                     'All occupied housing units (Lower)': hhs_alll,
-                     'All occupied housing units (Upper)': hhs_allu,                            
-                     'At least one extra bedroom': hh12p60o_2r,
-                     'At least one extra bedroom MoE': hh12p60o_2rmoe,
-                     'At least one extra bedroom MoE (%)': hh12p60o_2rmoep,
-                     'At least one extra bedroom (Lower)': hh12p60o_2rl,
-                     'At least one extra bedroom (Upper)': hh12p60o_2ru,
-                     'At least two extra bedrooms': hh12p60o_3r,
-                     'At least two extra bedrooms MoE': hh12p60o_3rmoe,
-                     'At least two extra bedrooms MoE (%)': hh12p60o_3rmoep,
-                     'At least two extra bedrooms (Lower)': hh12p60o_3rl,
-                     'At least two extra bedrooms (Upper)': hh12p60o_3ru,
-                     'Cost-burdened (30%) with at least one extra bedroom': hh12p60o_2r_cb30,
-                     'Cost-burdened (30%) with at least one extra bedroom MoE': hh12p60o_2r_cb30moe,
-                     'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh12p60o_2r_cb30moep,
-                     'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh12p60o_2r_cb30l,
-                     'Cost-burdened (30%) 60 with at least one extra bedroom (Upper)': hh12p60o_2r_cb30u,
-                     'Cost-burdened (30%) with at least two extra bedrooms': hh12p60o_3r_cb30,
-                     'Cost-burdened (30%) with at least two extra bedrooms MoE': hh12p60o_3r_cb30moe,
-                     'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh12p60o_3r_cb30moep,
-                     'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh12p60o_3r_cb30l,
-                     'Cost-burdened (30%) 60 with at least two extra bedrooms (Upper)': hh12p60o_3r_cb30u,
-                     'Cost-burdened (50%) with at least one extra bedroom': hh12p60o_2r_cb50,
-                     'Cost-burdened (50%) with at least one extra bedroom MoE': hh12p60o_2r_cb50moe,
-                     'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh12p60o_2r_cb50moep,
-                     'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh12p60o_2r_cb50l,
-                     'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh12p60o_2r_cb50u,
-                     'Cost-burdened (50%) with at least two extra bedrooms': hh12p60o_3r_cb50,
-                     'Cost-burdened (50%) with at least two extra bedrooms MoE': hh12p60o_3r_cb50moe,
-                     'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh12p60o_3r_cb50moep,
-                     'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh12p60o_3r_cb50l,
-                     'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh12p60o_3r_cb50u}
-                              
-supplypuma_single65plus = {'PUMA': PUMAs_study,
-                           'PUMA Name': pumanames,
-                           'All occupied housing units': hhs_all,
-                           'All occupied housing units MoE': hhs_allmoe,
-                           'All occupied housing units MoE (%)': hhs_allmoep,
-                           'All occupied housing units (Lower)': hhs_alll,
-                           'All occupied housing units (Upper)': hhs_allu,
-                           'At least one extra bedroom': hh1p65o_2r,
-                           'At least one extra bedroom MoE': hh1p65o_2rmoe,
-                           'At least one extra bedroom MoE (%)': hh1p65o_2rmoep,
-                           'At least one extra bedroom (Lower)': hh1p65o_2rl,
-                           'At least one extra bedroom (Upper)': hh1p65o_2ru,
-                           'At least two extra bedrooms': hh1p65o_3r,
-                           'At least two extra bedrooms MoE': hh1p65o_3rmoe,
-                           'At least two extra bedrooms MoE (%)': hh1p65o_3rmoep,
-                           'At least two extra bedrooms (Lower)': hh1p65o_3rl,
-                           'At least two extra bedrooms (Upper)': hh1p65o_3ru,
-                           'Cost-burdened (30%) with at least one extra bedroom': hh1p65o_2r_cb30,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE': hh1p65o_2r_cb30moe,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh1p65o_2r_cb30moep,
-                           'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh1p65o_2r_cb30l,
-                           'Cost-burdened (30%) with at least one extra bedroom (Upper)': hh1p65o_2r_cb30u,
-                           'Cost-burdened (30%) with at least two extra bedrooms': hh1p65o_3r_cb30,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE': hh1p65o_3r_cb30moe,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh1p65o_3r_cb30moep,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh1p65o_3r_cb30l,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Upper)': hh1p65o_3r_cb30u,
-                           'Cost-burdened (50%) with at least one extra bedroom': hh1p65o_2r_cb50,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE': hh1p65o_2r_cb50moe,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh1p65o_2r_cb50moep,
-                           'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh1p65o_2r_cb50l,
-                           'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh1p65o_2r_cb50u,
-                           'Cost-burdened (50%) with at least two extra bedrooms': hh1p65o_3r_cb50,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE': hh1p65o_3r_cb50moe,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh1p65o_3r_cb50moep,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh1p65o_3r_cb50l,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh1p65o_3r_cb50u}
-                           
-supplypuma_couple65plus = {'PUMA': PUMAs_study,
-                           'PUMA Name': pumanames,
-                           'All occupied housing units': hhs_all,
-                           'All occupied housing units MoE': hhs_allmoe,
-                           'All occupied housing units MoE (%)': hhs_allmoep,
-                           'All occupied housing units (Lower)': hhs_alll,
-                           'All occupied housing units (Upper)': hhs_allu,
-                           'At least one extra bedroom': hh2p65o_2r,
-                           'At least one extra bedroom MoE': hh2p65o_2rmoe,
-                           'At least one extra bedroom MoE (%)': hh2p65o_2rmoep,
-                           'At least one extra bedroom (Lower)': hh2p65o_2rl,
-                           'At least one extra bedroom (Upper)': hh2p65o_2ru,
-                           'At least two extra bedrooms': hh2p65o_3r,
-                           'At least two extra bedrooms MoE': hh2p65o_3rmoe,
-                           'At least two extra bedrooms MoE (%)': hh2p65o_3rmoep,
-                           'At least two extra bedroom (Lower)': hh2p65o_3rl,
-                           'At least two extra bedroom (Upper)': hh2p65o_3ru,
-                           'Cost-burdened (30%) with at least one extra bedroom': hh2p65o_2r_cb30,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE': hh2p65o_2r_cb30moe,
-                           'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh2p65o_2r_cb30moep,
-                           'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh2p65o_2r_cb30l,
-                           'Cost-burdened (30%) with at least one extra bedroom (Upper)': hh2p65o_2r_cb30u,
-                           'Cost-burdened (30%) with at least two extra bedrooms': hh2p65o_3r_cb30,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE': hh2p65o_3r_cb30moe,
-                           'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh2p65o_3r_cb30moep,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh2p65o_3r_cb30l,
-                           'Cost-burdened (30%) with at least two extra bedrooms (Upper)': hh2p65o_3r_cb30u,
-                           'Cost-burdened (50%) with at least one extra bedroom': hh2p65o_2r_cb50,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE': hh2p65o_2r_cb50moe,
-                           'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh2p65o_2r_cb50moep,
-                           'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh2p65o_2r_cb50l,
-                           'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh2p65o_2r_cb50u,
-                           'Cost-burdened (50%) with at least two extra bedrooms': hh2p65o_3r_cb50,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE': hh2p65o_3r_cb50moe,
-                           'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh2p65o_3r_cb50moep,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh2p65o_3r_cb50l,
-                           'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh2p65o_3r_cb50u}
-
-supplypuma_65plus = {'PUMA': PUMAs_study,
-                     'PUMA Name': pumanames,
-                     'All occupied housing units': hhs_all,
-                     'All occupied housing units MoE': hhs_allmoe,
-                     'All occupied housing units MoE (%)': hhs_allmoep,
-                     'All occupied housing units (Lower)': hhs_alll,
-                     'All occupied housing units (Upper)': hhs_allu,
-                     'At least one extra bedroom': hh12p65o_2r,
-                     'At least one extra bedroom MoE': hh12p65o_2rmoe,
-                     'At least one extra bedroom MoE (%)': hh12p65o_2rmoep,
-                     'At least one extra bedroom (Lower)': hh12p65o_2rl,
-                     'At least one extra bedroom (Upper)': hh12p65o_2ru,
-                     'At least two extra bedrooms': hh12p65o_3r,
-                     'At least two extra bedrooms MoE': hh12p65o_3rmoe,
-                     'At least two extra bedrooms MoE (%)': hh12p65o_3rmoep,
-                     'At least two extra bedroom (Lower)': hh12p65o_3rl,
-                     'At least two extra bedroom (Upper)': hh12p65o_3ru,
-                     'Cost-burdened (30%) with at least one extra bedroom': hh12p65o_2r_cb30,
-                     'Cost-burdened (30%) with at least one extra bedroom MoE': hh12p65o_2r_cb30moe,
-                     'Cost-burdened (30%) with at least one extra bedroom MoE (%)': hh12p65o_2r_cb30moep,
-                     'Cost-burdened (30%) with at least one extra bedroom (Lower)': hh12p65o_2r_cb30l,
-                     'Cost-burdened (30%) with at least one extra bedroom (Upper)': hh12p65o_2r_cb30u,
-                     'Cost-burdened (30%) with at least two extra bedrooms': hh12p65o_3r_cb30,
-                     'Cost-burdened (30%) with at least two extra bedrooms MoE': hh12p65o_3r_cb30moe,
-                     'Cost-burdened (30%) with at least two extra bedrooms MoE (%)': hh12p65o_3r_cb30moep,
-                     'Cost-burdened (30%) with at least two extra bedrooms (Lower)': hh12p65o_3r_cb30l,
-                     'Cost-burdened (30%) with at least two extra bedrooms (Upper)': hh12p65o_3r_cb30u,
-                     'Cost-burdened (50%) with at least one extra bedroom': hh12p65o_2r_cb50,
-                     'Cost-burdened (50%) with at least one extra bedroom MoE': hh12p65o_2r_cb50moe,
-                     'Cost-burdened (50%) with at least one extra bedroom MoE (%)': hh12p65o_2r_cb50moep,
-                     'Cost-burdened (50%) with at least one extra bedroom (Lower)': hh12p65o_2r_cb50l,
-                     'Cost-burdened (50%) with at least one extra bedroom (Upper)': hh12p65o_2r_cb50u,
-                     'Cost-burdened (50%) with at least two extra bedrooms': hh12p65o_3r_cb50,
-                     'Cost-burdened (50%) with at least two extra bedrooms MoE': hh12p65o_3r_cb50moe,
-                     'Cost-burdened (50%) with at least two extra bedrooms MoE (%)': hh12p65o_3r_cb50moep,
-                     'Cost-burdened (50%) with at least two extra bedrooms (Lower)': hh12p65o_3r_cb50l,
-                     'Cost-burdened (50%) with at least two extra bedrooms (Upper)': hh12p65o_3r_cb50u}
-
-intergen_PUMA_single60plus = pd.DataFrame(data = supplypuma_single60plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_single_60plus.csv"
-intergen_PUMA_single60plus.to_csv(filedest)
-
-intergen_PUMA_couple60plus = pd.DataFrame(data = supplypuma_couple60plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_couple_60plus.csv"
-intergen_PUMA_couple60plus.to_csv(filedest)
-
-intergen_PUMA_60plus = pd.DataFrame(data = supplypuma_60plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_60plus.csv"
-intergen_PUMA_couple60plus.to_csv(filedest)
-
-
-intergen_PUMA_single65plus = pd.DataFrame(data = supplypuma_single65plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_single_65plus.csv"
-intergen_PUMA_single65plus.to_csv(filedest)
-
-intergen_PUMA_couple65plus = pd.DataFrame(data = supplypuma_couple65plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_couple_65plus.csv"
-intergen_PUMA_couple65plus.to_csv(filedest)
-
-intergen_PUMA_65plus = pd.DataFrame(data = supplypuma_65plus)
-filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_65plus.csv"
-intergen_PUMA_65plus.to_csv(filedest)
+# PUMAs compared pairwise (difference, replicate MoE and significance for
+# every cohort); None compares every PUMA in the file
+pairwise_pumas = PUMAs_study
+
+# Custom regions (municipal groupings, RPA subregions, service areas) as
+# PUMA -> region, summed from the cube's replicate totals without a rescan
+study_regions = {3301: 'Boston', 3302: 'Boston', 3303: 'Boston', 3304: 'Boston', 3305: 'Boston'}
+
+# Supply/demand matching: (supply cohort, demand cohort) pairs whose ratio
+# (supply households per demand household) is estimated, with a replicate
+# MoE, for every PUMA and region; None for default_pairs()
+match_pairs = None
+
+# Cost-burden sweep: set to thresholds (e.g. SWEEP_OCPIP, every whole OCPIP
+# percentage) to estimate every cohort at each cut point for every PUMA
+sweep_thresholds = None
+
+# Tract-level estimates: set to a local Geocorr PUMA -> tract relationship
+# file to allocate every cohort's replicate totals down to tracts
+tract_xwalkfile = None
+
+# Formats of the long table of every cohort and geography: parquet (needs
+# pyarrow) and/or csv. Set excel_views to also write the wide tables as
+# sheets of one workbook (needs openpyxl).
+long_formats = LONG_FORMATS
+excel_views = False
+
+
+# Pipeline stages (see stage_dag), computed on first use and memoized in
+# pipeline_session
+PIPELINE = {}
+pipeline_session = {}
+run_report = None
+
+
+def get(name, param = None):
+    # Result of a pipeline stage and whatever it depends on
+    return compute(PIPELINE, pipeline_session, name, param, run_report)
+
+
+def default_specs():
+    # All and occupied housing units (hhs_all, hhs_occ), the homeshare
+    # cohorts, by householder age with the person file, homeshare demand
+    # (renters by rent burden; young adults, students and single workers
+    # with the person file) and AMI bands with the AMI files
+    specs = [(TOTAL_COHORTS, TOTAL_NAME), (HOMESHARE_COHORTS, HOMESHARE_NAME)]
+    if ma_pfile:
+        specs.append((HOUSEHOLDER_COHORTS, HOUSEHOLDER_NAME))
+    specs.append((DEMAND_COHORTS if ma_pfile else HOUSING_DEMAND_COHORTS, DEMAND_NAME))
+    if ami_limitsfile and ami_xwalkfile:
+        specs.append((INCOME_COHORTS, INCOME_NAME))
+    return specs
+
+
+def default_pairs():
+    # Older owners with a spare bedroom against one-person rent-burdened
+    # renters, and the person-file demand cohorts
+    pairs = [('hh12p60o_2r', 'dm_rent1p_rb30'),
+             ('hh12p65o_2r', 'dm_rent1p_rb30')]
+    if ma_pfile:
+        pairs += [('hh12p60o_2r', 'dm_ya_rb30'),
+                  ('hh12p60o_2r', 'dm_stu'),
+                  ('hh12p60o_2r', 'dm_wkr1p_rb30')]
+    return pairs
+
+
+@add_stage(PIPELINE, 'config')
+def run_config():
+    # Cohort specs, match pairs, columns to load and tag thresholds, from
+    # the module settings as they are when the run first needs them
+    specs = default_specs() if cohort_specs is None else list(cohort_specs)
+    spec_list = [spec for (spec, _) in specs]
+    return {'specs': specs,
+            'pairs': default_pairs() if match_pairs is None else list(match_pairs),
+            'usecols': hh_columns(spec_list, extra = [col for (col, _) in value_stats]),
+            'cb': spec_thresholds(spec_list, 'cb'),
+            'age': spec_thresholds(spec_list, 'HHAGE'),
+            'rb': spec_thresholds(spec_list, 'rb')}
+
+
+def all_cohorts(config):
+    # Every cohort name of the run, in cube order
+    names = []
+    for (spec, name) in config['specs']:
+        names += cohort_names(spec, name)
+    return names
+
+
+@add_stage(PIPELINE, 'ma_pumas')
+def read_pumanames():
+    # PUMA codes and names
+    ma_pumas = pd.read_csv(ma_pumafile, low_memory = False)
+    return ma_pumas[['puma5', 'puma_name']]
+
+
+@add_stage(PIPELINE, 'rep_cubekey', deps = ['config'])
+def rep_cubekey(config):
+    # Cache key of the run's replicate cube (see cube_cache), None with the
+    # cache turned off (pums_cachedir None)
+    if pums_cachedir is None:
+        return None
+    pums_files = [ma_hhfile] + ([ma_pfile] if ma_pfile else [])
+    if ami_limitsfile and ami_xwalkfile:
+        pums_files += [ami_limitsfile, ami_xwalkfile]
+    return cube_key(pums_files, config['specs'], None, cache_dir = pums_cachedir)
+
+
+@add_stage(PIPELINE, 'rep_cached', deps = ['rep_cubekey'])
+def cached_cube(key):
+    # Replicate cube straight from the cache when the source files and cohort
+    # specs are unchanged; None on a miss or without a cache
+    if key is None:
+        return None
+    return load_cube(pums_cachedir, key)
+
+
+@add_stage(PIPELINE, 'hh_persons')
+def person_features():
+    # Householder features reduced from the streamed person file
+    return householder_features(ma_pfile) if ma_pfile else None
+
+
+@add_stage(PIPELINE, 'ami_limits')
+def income_limits():
+    # Per-PUMA AMI limits lookup, None without the limits files
+    if not (ami_limitsfile and ami_xwalkfile):
+        return None
+    (areas, limits) = load_income_limits(ami_limitsfile)
+    return ami_lookup(load_area_crosswalk(ami_xwalkfile), areas, limits)
+
+
+@add_stage(PIPELINE, 'hh_pums', deps = ['config', 'hh_persons'])
+def household_pums(config, hh_persons):
+    # Housing rows with householder features joined; None when streaming
+    # (pums_chunksize), where each chunk is read as it is aggregated
+    if pums_chunksize:
+        return None
+    # Only the columns the cohort spec needs, with compact dtypes, through a local
+    # columnar snapshot so later runs skip the csv parse (see pums_load)
+    ma_hhpums = load_hhpums_cached(ma_hhfile, usecols = config['usecols'], cache_dir = pums_cachedir)
+    if ma_pfile:
+        ma_hhpums = join_householder(ma_hhpums, hh_persons)
+    return ma_hhpums
+
+
+def scan_cells(config, hh_pums, hh_persons, ami_limits = None, keep = (), cb_cuts = None):
+    # PUMA x flag cell keys (plus any keep columns) and their WGTP and
+    # WGTP1..80 sums; cb_cuts replaces the cost-burden thresholds (a sweep)
+    if cb_cuts is None:
+        cb_cuts = config['cb']
+    if hh_pums is None:
+        # Tag and aggregate each chunk, accumulating PUMA x flag cell sums
+        hh_chunks = iter_hhpums(ma_hhfile, usecols = config['usecols'], chunksize = pums_chunksize)
+        if ma_pfile:
+            hh_chunks = (join_householder(chunk, hh_persons) for chunk in hh_chunks)
+        return cell_totals_chunked(hh_chunks, cb_thresholds = cb_cuts, age_thresholds = config['age'],
+                                   rb_thresholds = config['rb'], keep = keep, ami_limits = ami_limits)
+
+    # Tag each household once and collapse to PUMA x flag cells in a single
+    # grouped aggregation (see cube_engine)
+    hh_tags = tag_households(hh_pums, cb_thresholds = cb_cuts, age_thresholds = config['age'],
+                             rb_thresholds = config['rb'], keep = keep, ami_limits = ami_limits)
+    return cell_totals(hh_tags, hh_pums[WGTP_COLS])
+
+
+def cohort_masks(config, cells, only = None):
+    # {cohort: mask over cells} for every cohort of the run (or those in only)
+    masks = {}
+    for (spec, name) in config['specs']:
+        masks.update(compile_cohorts(cells, spec, name, only = only))
+    return masks
+
+
+@add_stage(PIPELINE, 'hh_cells', deps = ['config', 'hh_pums', 'hh_persons', 'ami_limits'])
+def household_cells(config, hh_pums, hh_persons, ami_limits):
+    return scan_cells(config, hh_pums, hh_persons, ami_limits)
+
+
+@add_stage(PIPELINE, 'value_cells', deps = ['config', 'hh_pums', 'hh_persons', 'ami_limits'], param = True)
+def value_cells(col, config, hh_pums, hh_persons, ami_limits):
+    # Cells with housing value col as one more key
+    return scan_cells(config, hh_pums, hh_persons, ami_limits, keep = [col])
+
+
+@add_stage(PIPELINE, 'cohort_cube', deps = ['config', 'rep_cached'], param = True)
+def cohort_cube(cohorts, config, rep_cached):
+    # (PUMAs, PUMA x cohort x 81 totals) for a tuple of cohort names
+    if rep_cached is not None:
+        (PUMAs_ma, names, rep_cube) = rep_cached
+        return PUMAs_ma, rep_cube[:, [names.index(c) for c in cohorts]]
+
+    # Cohort masks over the cells, compiled from the declarative specs
+    # (household type x 60+/65+ x extra bedrooms x cost burden, see
+    # cohort_spec), only for cohorts not yet summed in this session
+    missing = [c for c in cohorts if ('cohort_sums', c) not in pipeline_session]
+    if missing:
+        (hh_cells, hh_cellwgts) = get('hh_cells')
+        masks = cohort_masks(config, hh_cells, only = missing)
+        (PUMAs_ma, sums) = puma_cube(hh_cells, hh_cellwgts, np.column_stack(list(masks.values())))
+        pipeline_session['cube_pumas'] = PUMAs_ma
+        for (j, cohort) in enumerate(masks):
+            pipeline_session[('cohort_sums', cohort)] = sums[:, j]
+    sums = np.stack([pipeline_session[('cohort_sums', c)] for c in cohorts], axis = 1)
+    return pipeline_session['cube_pumas'], sums
+
+
+@add_stage(PIPELINE, 'rep_cube', deps = ['config', 'rep_cached', 'rep_cubekey'])
+def statewide_cube(config, rep_cached, key):
+    # Statewide cube of every cohort: (PUMAs, cohort names, PUMA x cohort x
+    # WGTP and WGTP1..80 totals), saved to the cache
+    if rep_cached is not None:
+        return rep_cached
+    names = all_cohorts(config)
+    (PUMAs_ma, rep_cube) = get('cohort_cube', tuple(names))
+    if key is not None:
+        save_cube(pums_cachedir, key, PUMAs_ma, names, rep_cube)
+    return PUMAs_ma, names, rep_cube
+
+
+@add_stage(PIPELINE, 'pumanames', deps = ['ma_pumas'])
+def study_pumanames(ma_pumas):
+    return list(ma_pumas.set_index('puma5')['puma_name'].reindex(PUMAs_study))
+
+
+def puma_rows(PUMAs_ma, pumas):
+    # Positions of pumas in the cube's PUMAs; every one must be in the file
+    rows = PUMAs_ma.get_indexer(pumas)
+    if (rows < 0).any():
+        raise ValueError('PUMAs not in %s: %s' % (ma_hhfile, [puma for (puma, row) in zip(pumas, rows) if row < 0]))
+    return rows
+
+
+@add_stage(PIPELINE, 'study_est', param = True)
+def study_estimates(cohorts):
+    # {cohort: (est, moe, moep, upper, lower) arrays over PUMAs_study}
+    (PUMAs_ma, cube) = get('cohort_cube', cohorts)
+    study_idx = puma_rows(PUMAs_ma, PUMAs_study)
+    return dict(zip(cohorts, cube_est(cube[study_idx]).transpose(1, 2, 0)))
+
+
+@add_stage(PIPELINE, 'table', deps = ['pumanames'], param = True)
+def supply_table(table, pumanames):
+    # Wide table of one SUPPLY_TABLES household group for the study PUMAs
+    cohorts = table_cohorts(SUPPLY_TABLES[table])
+    est = get('study_est', cohorts)
+    supplypuma = {'PUMA': PUMAs_study, 'PUMA Name': pumanames}
+    for ((label, _), cohort) in zip(SUPPLY_COLUMNS, cohorts):
+        for (suffix, j) in SUPPLY_STATS:
+            supplypuma[label + suffix] = est[cohort][j]
+    return pd.DataFrame(data = supplypuma)
+
+
+@add_stage(PIPELINE, 'table_views')
+def supply_table_views():
+    # Every wide table, as {sheet name: table} for a workbook
+    return dict((table, get('table', table)) for table in SUPPLY_TABLES)
+
+
+@add_stage(PIPELINE, 'region_cube', deps = ['rep_cube'])
+def region_cube(rep):
+    # (regions, cohort names, region x cohort x 81 totals)
+    (PUMAs_ma, names, rep_cube) = rep
+    return regroup_cube(PUMAs_ma, rep_cube, study_regions) + (names,)
+
+
+@add_stage(PIPELINE, 'regions', deps = ['region_cube'])
+def region_estimates(regions):
+    (regions, region_cube, names) = regions
+    return cube_frame(regions, names, region_cube)
+
+
+@add_stage(PIPELINE, 'cb_sweep', deps = ['config', 'hh_pums', 'hh_persons', 'ami_limits'])
+def cost_burden_sweep(config, hh_pums, hh_persons, ami_limits):
+    # Every cohort with a cost-burden dimension at each of sweep_thresholds
+    # for every PUMA, from cells tagged at the sweep's cut points
+    (sweep_cells, sweep_cellwgts) = scan_cells(config, hh_pums, hh_persons, ami_limits,
+                                               cb_cuts = sweep_thresholds)
+    sweep_masks = {}
+    for (spec, name) in config['specs']:
+        if 'cb' in spec:
+            sweep_masks.update(compile_cohorts(sweep_cells, *drop_dimension(spec, name, 'cb')))
+    (sweep_pumas, sweep_cuts, cb_sweep) = threshold_sweep(sweep_cells, sweep_cellwgts,
+                                                          np.column_stack(list(sweep_masks.values())),
+                                                          'cb', sweep_thresholds)
+    return sweep_frame(sweep_pumas, sweep_masks, sweep_cuts, cb_sweep)
+
+
+@add_stage(PIPELINE, 'tract_cube', deps = ['rep_cube'])
+def tract_cube(rep):
+    # Every cohort allocated down to tracts through tract_xwalkfile:
+    # (tracts, cohort names, tract x cohort x 81 totals)
+    (PUMAs_ma, names, rep_cube) = rep
+    tract_xwalk = load_crosswalk(tract_xwalkfile)
+    (tracts, tract_alloc) = allocation_matrix(tract_xwalk, PUMAs_ma)
+    return tracts, allocate_cube(tract_alloc, rep_cube), names
+
+
+@add_stage(PIPELINE, 'tracts', deps = ['tract_cube'])
+def tract_estimates(tracts):
+    (tracts, tract_cube, names) = tracts
+    return cube_frame(tracts, names, tract_cube)
+
+
+@add_stage(PIPELINE, 'supply_long', deps = ['config', 'rep_cube', 'region_cube'])
+def supply_long(config, rep, regions):
+    # One tidy table of every cohort for PUMAs, regions and (when
+    # configured) tracts, with cohort dimensions and replicate totals
+    levels = pd.concat([cohort_levels(spec, name) for (spec, name) in config['specs']], ignore_index = True)
+    (PUMAs_ma, names, rep_cube) = rep
+    parts = [long_frame(PUMAs_ma, names, rep_cube, levels, geo_type = 'puma', share_of = 'hhs_occ'),
+             long_frame(regions[0], names, regions[1], levels, geo_type = 'region', share_of = 'hhs_occ')]
+    if tract_xwalkfile:
+        (tracts, tract_cube, _) = get('tract_cube')
+        parts.append(long_frame(tracts, names, tract_cube, levels, geo_type = 'tract', share_of = 'hhs_occ'))
+    return pd.concat(parts, ignore_index = True)
+
+
+@add_stage(PIPELINE, 'supply_demand', deps = ['config', 'rep_cube', 'region_cube'])
+def supply_demand(config, rep, regions):
+    # Supply/demand ratios of match_pairs for every PUMA and region
+    (PUMAs_ma, names, rep_cube) = rep
+    return pd.concat([ratio_frame(PUMAs_ma, names, rep_cube, config['pairs'], geo_type = 'puma'),
+                      ratio_frame(regions[0], names, regions[1], config['pairs'], geo_type = 'region')],
+                     ignore_index = True)
+
+
+@add_stage(PIPELINE, 'pairwise', deps = ['rep_cube'])
+def pairwise_differences(rep):
+    # Every cohort's difference between each pair of pairwise_pumas
+    (PUMAs_ma, names, rep_cube) = rep
+    if pairwise_pumas is not None:
+        keep = puma_rows(PUMAs_ma, pairwise_pumas)
+        (PUMAs_ma, rep_cube) = (PUMAs_ma[keep], rep_cube[keep])
+    return pairwise_frame(PUMAs_ma, names, rep_cube)
+
+
+@add_stage(PIPELINE, 'value_cube', deps = ['config', 'rep_cubekey'], param = True)
+def value_cube(value, config, key):
+    # (PUMAs, cohort names, PUMA x cohort x 81 replicate statistics) for a
+    # (column, statistic) of value_stats, through the cube cache
+    key = None if key is None else derived_key(key, 'value', *value)
+    cached = None if key is None else load_cube(pums_cachedir, key)
+    if cached is not None:
+        return cached
+    (col, stat) = value
+    (cells, cellwgts) = get('value_cells', col)
+    masks = cohort_masks(config, cells)
+    (PUMAs_ma, cube) = stat_cube(cells, cellwgts, np.column_stack(list(masks.values())), col, stat)
+    if key is not None:
+        save_cube(pums_cachedir, key, PUMAs_ma, list(masks), cube)
+    return PUMAs_ma, list(masks), cube
+
+
+@add_stage(PIPELINE, 'value_stats')
+def value_statistics():
+    # value_stats of every cohort for every PUMA, with replicate MoEs
+    frames = []
+    for (col, stat) in value_stats:
+        frame = cube_frame(*get('value_cube', (col, stat)))
+        frame.insert(1, 'value', col)
+        frame.insert(2, 'stat', stat if stat == 'mean' else 'p%g' % (100*stat))
+        frames.append(frame)
+    return pd.concat(frames, ignore_index = True)
+
+
+# Wide tables for the study PUMAs: column label and cohort suffix (None for
+# all occupied housing units), each with its estimate, MoE, MoE (%) and bounds
+SUPPLY_COLUMNS = [('All occupied housing units', None),
+                  ('At least one extra bedroom', '_2r'),
+                  ('At least two extra bedrooms', '_3r'),
+                  ('Cost-burdened (30%) with at least one extra bedroom', '_2r_cb30'),
+                  ('Cost-burdened (30%) with at least two extra bedrooms', '_3r_cb30'),
+                  ('Cost-burdened (50%) with at least one extra bedroom', '_2r_cb50'),
+                  ('Cost-burdened (50%) with at least two extra bedrooms', '_3r_cb50')]
+# Label suffix and position in the (est, moe, moep, upper, lower) arrays
+SUPPLY_STATS = [('', 0), (' MoE', 1), (' MoE (%)', 2), (' (Lower)', 4), (' (Upper)', 3)]
+
+# Household group (cohort prefix) of each wide table
+SUPPLY_TABLES = {'single60plus': 'hh1p60o',
+                 'couple60plus': 'hh2p60o',
+                 '60plus': 'hh12p60o',
+                 'single65plus': 'hh1p65o',
+                 'couple65plus': 'hh2p65o',
+                 '65plus': 'hh12p65o'}
+
+
+def table_cohorts(prefix):
+    # Cohorts of a wide table, in SUPPLY_COLUMNS order
+    return tuple('hhs_occ' if suffix is None else prefix + suffix for (_, suffix) in SUPPLY_COLUMNS)
+
+
+# Output files: name -> (destinations, pipeline stage, stage parameter,
+# write the index). Files are written atomically on a background thread
+# (see output_writer).
+supply_long_file = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_supply_long"
+OUTPUTS = {'supply_long': ([supply_long_file + '.' + fmt for fmt in long_formats], 'supply_long', None, False),
+           'supply_demand': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_supply_demand.csv"], 'supply_demand', None, False),
+           'pumas_pairwise': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_pairwise.csv"], 'pairwise', None, False),
+           'value_stats': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_value_stats.csv"], 'value_stats', None, False),
+           'pumas_single_60plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_single_60plus.csv"], 'table', 'single60plus', True),
+           'pumas_couple_60plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_couple_60plus.csv"], 'table', 'couple60plus', True),
+           'pumas_60plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_60plus.csv"], 'table', '60plus', True),
+           'pumas_single_65plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_single_65plus.csv"], 'table', 'single65plus', True),
+           'pumas_couple_65plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_couple_65plus.csv"], 'table', 'couple65plus', True),
+           'pumas_65plus': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_65plus.csv"], 'table', '65plus', True),
+           'pumas_xlsx': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas.xlsx"], 'table_views', None, False),
+           'regions': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_regions.csv"], 'regions', None, True),
+           'pumas_cbsweep': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_pumas_cbsweep.csv"], 'cb_sweep', None, True),
+           'tracts': (["K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_tracts.csv"], 'tracts', None, True)}
+
+
+def enabled_outputs():
+    # Outputs a full run writes; the workbook, value statistics, sweep and
+    # tracts only when configured
+    optional = {'pumas_xlsx': excel_views, 'value_stats': value_stats, 'pumas_cbsweep': sweep_thresholds,
+                'tracts': tract_xwalkfile}
+    return [output for output in OUTPUTS if optional.get(output, True)]
+
+
+def write_outputs(outputs = None, writer = None):
+    # Compute and write the named outputs (default: enabled_outputs()),
+    # running only the stages they need. With a writer (see
+    # output_writer.start_writer) files are written in the background;
+    # finish_writes(writer) waits for them.
+    for output in (enabled_outputs() if outputs is None else outputs):
+        (filedests, name, param, index) = OUTPUTS[output]
+        frame = get(name, param)
+        for filedest in filedests:
+            write_async(writer, frame, filedest, index = index)
+
+
+def main():
+    # Write every enabled output with a run report
+    global run_report
+    run_report = new_report(memory = profile_run, profile = profile_run)
+    writer = start_writer()
+    try:
+        write_outputs(writer = writer)
+    finally:
+        with stage(run_report, 'write_wait'):
+            finish_writes(writer)
+    # Stage timings, memory and row counts for this run
+    filedest = "K:\\DataServices\\Projects\\Current_Projects\\Housing\\Intergenerational_Homesharing\\Data\\Tabular\\intergen_run_report.json"
+    write_report(run_report, filedest)
+
+
+if __name__ == '__main__':
+    main()
 
 # # PUMAs
 # def errplot(x, y, yerr, **kwargs):
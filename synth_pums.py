@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic PUMS housing files.
+
+Writes files with the housing columns the estimation uses (RT, SERIALNO, ST,
+PUMA, TYPE, TEN, NP, BDSP, R60, R65, OCPIP, GRPIP, PARTNER, HHT, SSMC, HINCP,
+ADJHSG, ADJINC, WGTP, WGTP1..80), one psam_hSS.csv per state, at roughly the
+size of the 5-year files. Blanks follow PUMS: household fields are N/A for
+group quarters and vacant units. Values are random but internally
+consistent (couples have 2+ persons, R65 <= R60 <= NP), and every state is
+generated from its own seed, so a file is identical whatever else is
+generated alongside it.
+
+Usage:
+    python synth_pums.py outdir --scale newengland
+    python synth_pums.py outdir --scale state --factor 0.1
+"""
+
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from replicate_est import WGTP_COLS
+
+# Housing records and PUMAs in a 5-year state file
+NEW_ENGLAND = {9: (90000, 26), 23: (40000, 10), 25: (175000, 52),
+               33: (35000, 10), 44: (25000, 7), 50: (20000, 4)}
+
+# 50 states and DC, about 7.5 million housing records and 2,350 PUMAs
+NATIONAL_STATES = [1, 2, 4, 5, 6, 8, 9, 10, 11, 12, 13, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
+                   26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 44, 45, 46,
+                   47, 48, 49, 50, 51, 53, 54, 55, 56]
+
+SCALES = {'state': {25: NEW_ENGLAND[25]},
+          'newengland': NEW_ENGLAND,
+          'national': dict((st, NEW_ENGLAND.get(st, (147000, 46))) for st in NATIONAL_STATES)}
+
+
+def synth_hhpums(st, nrows, npumas, seed = 0, year = 2018):
+    # One state's synthetic housing records as a DataFrame
+    rng = np.random.default_rng([seed, st])
+    pumas = 100*np.arange(1, npumas + 1)
+    hh = pd.DataFrame({'RT': 'H',
+                       'SERIALNO': ['%dHU%07d' % (year, i) for i in range(1, nrows + 1)],
+                       'ST': st,
+                       'PUMA': rng.choice(pumas, nrows)})
+
+    # 1 housing unit, 2-3 group quarters; vacant units are NP 0
+    unittype = rng.choice([1, 2, 3], nrows, p = [0.96, 0.03, 0.01])
+    np_ = np.where(unittype == 1, rng.choice([0, 1, 2, 3, 4, 5], nrows, p = [0.1, 0.25, 0.3, 0.15, 0.13, 0.07]), 1)
+    occupied = (unittype == 1) & (np_ > 0)
+    hh['TYPE'] = unittype
+    hh['NP'] = np_
+
+    def na_unless(values, keep):
+        # Nullable column, N/A where keep is False
+        return pd.Series(values, dtype = 'Int32').where(keep)
+    def occ(values):
+        # N/A outside occupied housing units
+        return na_unless(values, occupied)
+
+    hh['TEN'] = occ(rng.choice([1, 2, 3, 4], nrows, p = [0.4, 0.2, 0.38, 0.02]))
+    hh['BDSP'] = na_unless(rng.choice([0, 1, 2, 3, 4, 5], nrows, p = [0.03, 0.15, 0.3, 0.33, 0.14, 0.05]),
+                           unittype == 1)
+    n60 = np.minimum(rng.choice([0, 1, 2], nrows, p = [0.6, 0.25, 0.15]), np_)
+    n65 = np.minimum(n60, rng.choice([0, 1, 2], nrows, p = [0.3, 0.3, 0.4]))
+    hh['R60'] = occ(n60)
+    hh['R65'] = occ(n65)
+    owner = occupied & (hh['TEN'].isin([1, 2]).fillna(False).values)
+    ocpip = np.minimum(np.round(rng.gamma(2.0, 12.0, nrows)), 101)
+    hh['OCPIP'] = na_unless(ocpip.astype(np.int32), owner)
+
+    couple = occupied & (np_ >= 2) & (rng.random(nrows) < 0.55)
+    married = couple & (rng.random(nrows) < 0.8)
+    hh['HHT'] = occ(np.where(married, 1, np.where(couple, rng.choice([2, 3], nrows),
+                                                  rng.choice([2, 3, 4, 5, 6, 7], nrows))))
+    # Unmarried partner households are PARTNER 2-5, as tag_households reads them
+    hh['PARTNER'] = occ(np.where(couple & ~married, rng.choice([2, 3, 4, 5], nrows), 0))
+    hh['SSMC'] = occ(np.where(couple & (rng.random(nrows) < 0.02), rng.choice([1, 2], nrows), 0))
+    hh['HINCP'] = occ(np.round(rng.lognormal(11.0, 0.9, nrows), -2).astype(np.int64))
+    hh['ADJHSG'] = 1000000
+    hh['ADJINC'] = 1011189
+
+    # Replicate weights scattered around WGTP; 0 for group quarters
+    wgtp = np.where(unittype == 1, rng.integers(1, 60, nrows), 0)
+    reps = np.maximum(0, np.rint(wgtp[:, None]*rng.normal(1.0, 0.25, (nrows, 80)))).astype(np.int32)
+    hh['WGTP'] = wgtp
+    for (j, col) in enumerate(WGTP_COLS[1:]):
+        hh[col] = reps[:, j]
+
+    # Gross rent as % of income for renters (TEN 3), drawn last so the
+    # columns above are the same as in files generated without it
+    renter = occupied & (hh['TEN'] == 3).fillna(False).values
+    grpip = np.minimum(np.round(rng.gamma(2.5, 13.0, nrows)), 101)
+    hh.insert(hh.columns.get_loc('OCPIP') + 1, 'GRPIP', na_unless(grpip.astype(np.int32), renter))
+    return hh
+
+
+def write_synth(outdir, scale = 'state', factor = 1.0, seed = 0, year = 2018, overwrite = True):
+    # Write psam_hSS.csv files for a scale ('state', 'newengland' or
+    # 'national'), with record counts times factor. Returns the file paths.
+    # With overwrite False, files already in outdir are kept (generation is
+    # deterministic, so they only differ if seed or year changed).
+    os.makedirs(outdir, exist_ok = True)
+    hhfiles = []
+    for (st, (nrows, npumas)) in sorted(SCALES[scale].items()):
+        hhfile = os.path.join(outdir, 'psam_h%02d.csv' % st)
+        if overwrite or not os.path.exists(hhfile):
+            synth_hhpums(st, max(1, int(nrows*factor)), npumas, seed, year).to_csv(hhfile, index = False)
+        hhfiles.append(hhfile)
+    return hhfiles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Deterministic synthetic PUMS housing files')
+    parser.add_argument('outdir', help = 'directory for the psam_hSS.csv files')
+    parser.add_argument('--scale', choices = sorted(SCALES), default = 'state')
+    parser.add_argument('--factor', type = float, default = 1.0, help = 'multiply record counts by this')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--year', type = int, default = 2018, help = 'vintage in SERIALNO')
+    args = parser.parse_args()
+
+    for hhfile in write_synth(args.outdir, args.scale, args.factor, args.seed, args.year):
+        print(hhfile)
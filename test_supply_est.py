@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline runs of supply_est_concise on a small synthetic state file.
+
+    python -m pytest -q test_supply_est.py
+"""
+
+
+import pandas as pd
+import pytest
+
+import supply_est_concise as supply
+from synth_pums import synth_hhpums
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    # The pipeline module configured for a synthetic state file, with an
+    # empty session
+    hhfile = tmp_path / 'psam_h25.csv'
+    synth_hhpums(25, 5000, 8).to_csv(hhfile, index = False)
+    pumafile = tmp_path / 'pumas.csv'
+    pd.DataFrame({'puma5': [100*k for k in range(1, 9)],
+                  'puma_name': ['PUMA %d' % k for k in range(1, 9)]}).to_csv(pumafile, index = False)
+    monkeypatch.setattr(supply, 'ma_hhfile', str(hhfile))
+    monkeypatch.setattr(supply, 'ma_pumafile', str(pumafile))
+    monkeypatch.setattr(supply, 'pums_cachedir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(supply, 'PUMAs_study', [100, 200, 300])
+    monkeypatch.setattr(supply, 'pipeline_session', {})
+    return supply
+
+
+def test_without_cache(pipeline, monkeypatch, tmp_path):
+    monkeypatch.setattr(pipeline, 'pums_cachedir', None)
+    table = pipeline.get('table', '65plus')
+    assert list(table['PUMA']) == [100, 200, 300]
+    assert (table['All occupied housing units'] > 0).all()
+    assert not (tmp_path / 'cache').exists()
+
+
+def test_sweep_streamed(pipeline, monkeypatch):
+    # The sweep streams like the cube, with cut points float32 can't hold
+    monkeypatch.setattr(pipeline, 'sweep_thresholds', [20, 33.3, 50])
+    loaded = pipeline.get('cb_sweep')
+    monkeypatch.setattr(pipeline, 'pipeline_session', {})
+    monkeypatch.setattr(pipeline, 'pums_chunksize', 1000)
+    streamed = pipeline.get('cb_sweep')
+    pd.testing.assert_frame_equal(loaded, streamed)
+    at = loaded.set_index(['PUMA', 'cohort', 'threshold'])['est']
+    assert (at.xs(33.3, level = 'threshold') >= at.xs(50, level = 'threshold')).all()
+    assert (at.xs(33.3, level = 'threshold') > 0).any()
+
+
+def test_person_file_set_after_import(pipeline, monkeypatch, tmp_path):
+    # Settings changed after import reach the cohorts and columns loaded
+    hh = pd.read_csv(pipeline.ma_hhfile, usecols = ['SERIALNO', 'NP'])
+    hh = hh[hh['NP'] > 0]
+    pfile = tmp_path / 'psam_p25.csv'
+    pd.DataFrame({'SERIALNO': hh['SERIALNO'], 'RELSHIPP': 20, 'AGEP': 30 + 2*(hh.index % 25),
+                  'DIS': 1 + hh.index % 2, 'ESR': 1 + 5*(hh.index % 2), 'SCHG': ''}).to_csv(pfile, index = False)
+    monkeypatch.setattr(pipeline, 'ma_pfile', str(pfile))
+    names = pipeline.get('rep_cube')[1]
+    assert 'hh12p65h_2r_emp_dis' in names and 'dm_ya_rb30' in names
+    assert ('hh12p60o_2r', 'dm_stu') in pipeline.get('config')['pairs']
+
+
+def test_value_stats_cached(pipeline, monkeypatch):
+    # A rerun with a warm cache reads no housing rows for value statistics
+    monkeypatch.setattr(pipeline, 'value_stats', [('OCPIP', 0.5), ('GRPIP', 'mean')])
+    pipeline.get('rep_cube')
+    first = pipeline.get('value_stats')
+    monkeypatch.setattr(pipeline, 'pipeline_session', {})
+    pipeline.get('rep_cube')
+    rerun = pipeline.get('value_stats')
+    pd.testing.assert_frame_equal(first, rerun)
+    assert 'hh_pums' not in pipeline.pipeline_session
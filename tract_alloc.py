@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Allocation of PUMA estimates down to census tracts.
+
+A tract-to-PUMA crosswalk with allocation factors (e.g. a Geocorr PUMA ->
+tract relationship file, where afact is the share of the PUMA falling in the
+tract) is turned once into a sparse (tracts x PUMAs) matrix. Allocating every
+cohort is then a single sparse product with the (PUMAs x cohorts x 81)
+replicate cube. The full-sample and replicate totals are carried down
+together, so tract MoEs come from the allocated replicates rather than
+being scaled from the PUMA MoE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def load_crosswalk(xwalkfile, puma_col = 'puma12', tract_cols = ('county', 'tract'),
+                   factor_col = 'afact', skiprows = (1,)):
+    # Crosswalk as columns PUMA, tract (11 digit GEOID) and afact. Defaults
+    # follow the Geocorr csv layout: 5 digit county FIPS, tract as 0001.00,
+    # and a second header row of labels (skipped).
+    xwalk = pd.read_csv(xwalkfile, skiprows = list(skiprows), dtype = str)
+    tract = ''
+    for col in tract_cols:
+        part = xwalk[col].str.replace('.', '', regex = False).str.strip()
+        tract = tract + part.str.zfill(5 if col == 'county' else 6)
+    return pd.DataFrame({'PUMA': xwalk[puma_col].astype(int),
+                         'tract': tract,
+                         'afact': xwalk[factor_col].astype(float)})
+
+
+def allocation_matrix(xwalk, geos, geo_cols = ('PUMA',), target_cols = ('tract',)):
+    # Sparse (targets x geos) matrix of allocation factors, with the targets
+    # (tract GEOIDs by default) as an Index. Crosswalk rows for PUMAs not in
+    # geos are dropped.
+    geo_cols = list(geo_cols)
+    target_cols = list(target_cols)
+    if len(geo_cols) == 1:
+        keys = pd.Index(xwalk[geo_cols[0]].values)
+    else:
+        keys = pd.MultiIndex.from_frame(xwalk[geo_cols])
+    col = geos.get_indexer(keys)
+    keep = col >= 0
+    if len(target_cols) == 1:
+        targets = pd.Index(xwalk[target_cols[0]].values[keep], name = target_cols[0])
+    else:
+        targets = pd.MultiIndex.from_frame(xwalk.loc[keep, target_cols])
+    (row, targets) = targets.factorize(sort = True)
+    targets.names = target_cols
+    alloc = sparse.csr_matrix((xwalk['afact'].values[keep], (row, col[keep])),
+                              shape = (len(targets), len(geos)))
+    return targets, alloc
+
+
+def allocate_cube(alloc, cube):
+    # (tracts x cohorts x 81) replicate cube from a (geos x cohorts x 81) cube
+    cube = np.asarray(cube)
+    flat = cube.reshape(cube.shape[0], -1)
+    return np.asarray(alloc @ flat).reshape((alloc.shape[0],) + cube.shape[1:])
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-vintage panel of the homeshare supply estimates.
+
+Each vintage's PUMS housing file (2010-2014 through 2019-2023 5-year files,
+or 1-year files) is mapped onto one harmonized schema before tagging:
+    PUMA    files spanning a redefinition carry PUMA00/PUMA10 or PUMA10/
+            PUMA20, with -9 where a record uses the other definition; each
+            record's code is taken from the column it is valid in, and the
+            definition kept alongside it
+    BDSP    older layouts call it BDS (same codes, top-coded at 5)
+    TYPE    2021 and later layouts call it TYPEHUGQ (same codes)
+    others  couple detail (PARTNER, SSMC) missing from a layout is N/A
+Records on a PUMA definition other than the panel's are carried over with a
+PUMA-to-PUMA crosswalk (e.g. Geocorr 2020 -> 2010 PUMAs) applied to the
+replicate cube, so every vintage reports on the same geographies with
+replicate-based MoEs.
+
+Differences between vintages (vintage_pairs) treat the vintages as
+independent samples, MoE sqrt(MoE_a^2 + MoE_b^2); overlapping 5-year
+vintages share years of sample, so Census advises comparing only
+non-overlapping ones.
+
+Vintages run in a process pool and share the parsed-input and cube caches
+(see pums_load and cube_cache), so adding a new year to the panel only
+parses and aggregates that year.
+
+Usage:
+    python vintage_panel.py panel.csv 2018=psam_h25_2018.csv 2023=psam_h25_2023.csv \\
+        --xwalk 2020=puma2020_to_2010.csv --pairs panel_pairs.csv
+"""
+
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cohort_spec import HOMESHARE_COHORTS, HOMESHARE_NAME, TOTAL_COHORTS, TOTAL_NAME, compile_cohorts, spec_thresholds
+from cube_cache import cube_key, load_cube, save_cube
+from cube_engine import cell_totals, cube_frame, pairwise_independent, puma_cube, tag_households
+from pums_load import hh_columns, load_hhpums_cached
+from replicate_est import WGTP_COLS
+from tract_alloc import allocate_cube, allocation_matrix
+
+# PUMA code columns and the definition each one uses, newest first
+PUMA_COLS = {'PUMA20': 2020, 'PUMA10': 2010, 'PUMA00': 2000}
+
+# Harmonized housing column -> column name in other layouts
+HH_RENAMES = {'BDSP': 'BDS', 'TYPE': 'TYPEHUGQ'}
+
+# Harmonized housing columns that some layouts lack; left N/A when missing
+HH_OPTIONAL = ['PARTNER', 'SSMC']
+
+
+def puma_definition(year):
+    # PUMA definition of a plain PUMA column in the file ending in year
+    if year <= 2011:
+        return 2000
+    if year <= 2021:
+        return 2010
+    return 2020
+
+
+def vintage_columns(hhfile, usecols):
+    # Raw columns to read from hhfile for the harmonized usecols
+    header = list(pd.read_csv(hhfile, nrows = 0).columns)
+    cols = []
+    for col in usecols:
+        if col == 'PUMA':
+            cols += [puma for puma in ['PUMA'] + list(PUMA_COLS) if puma in header]
+        elif col in header:
+            cols.append(col)
+        elif HH_RENAMES.get(col) in header:
+            cols.append(HH_RENAMES[col])
+        elif col not in HH_OPTIONAL:
+            raise ValueError('%s has no %s column' % (hhfile, col))
+    return cols
+
+
+def harmonize(hhpums, year, usecols):
+    # Harmonized frame with PUMA and its definition (PUMADEF) per record
+    hhpums = hhpums.rename(columns = {old: new for (new, old) in HH_RENAMES.items()})
+    puma = np.full(len(hhpums), -1, dtype = np.int32)
+    pumadef = np.full(len(hhpums), -1, dtype = np.int16)
+    sources = [(col, PUMA_COLS[col]) for col in PUMA_COLS if col in hhpums]
+    if 'PUMA' in hhpums:
+        sources.insert(0, ('PUMA', puma_definition(year)))
+    for (col, definition) in sources:
+        codes = np.asarray(hhpums[col], dtype = np.int32)
+        valid = (codes >= 0) & (pumadef < 0)
+        puma[valid] = codes[valid]
+        pumadef[valid] = definition
+    hhpums = hhpums.drop(columns = [col for (col, _) in sources])
+    hhpums['PUMA'] = puma
+    hhpums['PUMADEF'] = pumadef
+    for col in HH_OPTIONAL:
+        if col in usecols and col not in hhpums:
+            hhpums[col] = pd.array([pd.NA]*len(hhpums), dtype = 'UInt8')
+    return hhpums
+
+
+def load_puma_crosswalk(xwalkfile, from_col = 'puma22', to_col = 'puma12', state_col = 'state',
+                        factor_col = 'afact', skiprows = (1,)):
+    # PUMA-to-PUMA crosswalk as columns ST, PUMA (source), PUMA_TO (target)
+    # and afact, the share of the source PUMA falling in the target. Defaults
+    # follow the Geocorr csv layout, with a second header row of labels.
+    xwalk = pd.read_csv(xwalkfile, skiprows = list(skiprows), dtype = str)
+    return pd.DataFrame({'ST': xwalk[state_col].astype(int),
+                         'PUMA': xwalk[from_col].astype(int),
+                         'PUMA_TO': xwalk[to_col].astype(int),
+                         'afact': xwalk[factor_col].astype(float)})
+
+
+def _sum_cubes(parts):
+    # Add (geos, cube) parts over the union of their geographies
+    geos = parts[0][0].append([part[0] for part in parts[1:]])
+    (codes, union) = geos.factorize(sort = True)
+    union.names = parts[0][0].names
+    total = np.zeros((len(union),) + parts[0][1].shape[1:])
+    np.add.at(total, codes, np.concatenate([part[1] for part in parts]))
+    return union, total
+
+
+def vintage_cube(year, hhfile, spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME,
+                 puma_def = 2010, xwalks = None, cache_dir = None):
+    # (ST, PUMA) geographies on the puma_def definition, cohort names and
+    # replicate cube for one vintage. xwalks: {definition: crosswalk frame to
+    # puma_def}; every definition the records use other than puma_def needs one.
+    usecols = hh_columns([TOTAL_COHORTS, spec], extra = ['ST'])
+    hhpums = load_hhpums_cached(hhfile, usecols = vintage_columns(hhfile, usecols), cache_dir = cache_dir)
+    hhpums = harmonize(hhpums, year, usecols)
+    tags = tag_households(hhpums, cb_thresholds = spec_thresholds(spec, 'cb'))
+    xwalks = xwalks or {}
+    definitions = np.unique(hhpums['PUMADEF'].values)
+    missing = [str(d) for d in definitions if d != puma_def and d not in xwalks]
+    if missing:
+        raise ValueError('%s vintage %d: records on the %s PUMA definition and no crosswalk from it to %d'
+                         % (hhfile, year, ', '.join(missing), puma_def))
+
+    parts = []
+    cohorts = None
+    for definition in definitions:
+        rows = (hhpums['PUMADEF'] == definition).values
+        (cells, cellwgts) = cell_totals(tags[rows], hhpums.loc[rows, WGTP_COLS])
+        cohort_masks = compile_cohorts(cells, TOTAL_COHORTS, TOTAL_NAME)
+        cohort_masks.update(compile_cohorts(cells, spec, name))
+        cohorts = list(cohort_masks)
+        (geos, cube) = puma_cube(cells, cellwgts, np.column_stack(list(cohort_masks.values())),
+                                 geo_cols = ('ST', 'PUMA'))
+        if definition != puma_def:
+            # Carry the replicate totals onto the panel's PUMAs
+            (geos, alloc) = allocation_matrix(xwalks[definition], geos, geo_cols = ('ST', 'PUMA'),
+                                              target_cols = ('ST', 'PUMA_TO'))
+            geos.names = ['ST', 'PUMA']
+            cube = allocate_cube(alloc, cube)
+        parts.append((geos, cube))
+    (geos, cube) = _sum_cubes(parts)
+    return geos, cohorts, cube
+
+
+def _vintage_task(args):
+    return vintage_cube(*args)
+
+
+def vintage_panel(hhfiles, spec = HOMESHARE_COHORTS, name = HOMESHARE_NAME, puma_def = 2010,
+                  xwalkfiles = None, processes = None, cache_dir = None):
+    # Long panel (vintage, ST, PUMA, cohort, est, moe, ...) for hhfiles, a dict
+    # of vintage end year -> PUMS housing file. Cached vintages are read from
+    # cache_dir; the rest run in parallel and are added to it.
+    xwalkfiles = xwalkfiles or {}
+    xwalks = {definition: load_puma_crosswalk(f) for (definition, f) in xwalkfiles.items()}
+    years = sorted(hhfiles)
+
+    cubes = {}
+    keys = {}
+    for year in years:
+        # Cache key covers the source, the crosswalks and the target definition
+        keys[year] = cube_key([hhfiles[year]] + [xwalkfiles[d] for d in sorted(xwalkfiles)],
+                              spec, (name, year, puma_def, sorted(xwalkfiles)),
+                              geo_cols = ('ST', 'PUMA'), cache_dir = cache_dir)
+        if cache_dir is not None:
+            cubes[year] = load_cube(cache_dir, keys[year])
+
+    todo = [year for year in years if cubes.get(year) is None]
+    if todo:
+        tasks = [(year, hhfiles[year], spec, name, puma_def, xwalks, cache_dir) for year in todo]
+        with ProcessPoolExecutor(max_workers = processes) as pool:
+            for (year, result) in zip(todo, pool.map(_vintage_task, tasks)):
+                cubes[year] = result
+                if cache_dir is not None:
+                    save_cube(cache_dir, keys[year], *result)
+
+    frames = []
+    for year in years:
+        frame = cube_frame(*cubes[year])
+        frame.insert(0, 'vintage', year)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index = True)
+
+
+def vintage_pairs(panel):
+    # Difference between each ordered pair of vintages for every ST, PUMA
+    # and cohort of a vintage_panel, with its MoE and significance
+    wide = panel.set_index(['ST', 'PUMA', 'cohort', 'vintage'])[['est', 'moe']].unstack('vintage')
+    (est, moe) = (wide['est'], wide['moe'])
+    (diff, diffmoe, significant) = pairwise_independent(est.values, moe.values)
+    years = est.columns.values
+    (k, a, b) = np.nonzero(np.broadcast_to(~np.eye(len(years), dtype = bool), diff.shape))
+    frame = est.index.to_frame(index = False).iloc[k].reset_index(drop = True)
+    frame['vintage_a'] = years[a]
+    frame['vintage_b'] = years[b]
+    frame['est_a'] = est.values[k, a]
+    frame['est_b'] = est.values[k, b]
+    frame['difference'] = diff[k, a, b]
+    frame['moe'] = diffmoe[k, a, b]
+    frame['significant'] = significant[k, a, b]
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Homeshare supply estimates by PUMA for several PUMS vintages')
+    parser.add_argument('output', help = 'csv panel of estimates by vintage, ST, PUMA and cohort')
+    parser.add_argument('hhfiles', nargs = '+', help = 'YEAR=file pairs, YEAR the last year of the vintage')
+    parser.add_argument('--puma-def', type = int, default = 2010, help = 'PUMA definition to report on (2010 or 2020)')
+    parser.add_argument('--xwalk', action = 'append', default = [],
+                        help = 'DEFINITION=file PUMA crosswalk from another definition to --puma-def')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: CPU count)')
+    parser.add_argument('--cache-dir', default = None, help = 'shared cache for parsed inputs and cubes')
+    parser.add_argument('--pairs', default = None, help = 'csv of differences between every pair of vintages')
+    args = parser.parse_args()
+
+    hhfiles = dict((int(year), f) for (year, f) in (arg.split('=', 1) for arg in args.hhfiles))
+    xwalkfiles = dict((int(d), f) for (d, f) in (arg.split('=', 1) for arg in args.xwalk))
+    panel = vintage_panel(hhfiles, puma_def = args.puma_def, xwalkfiles = xwalkfiles, processes = args.processes,
+                          cache_dir = args.cache_dir)
+    panel.to_csv(args.output, index = False)
+    if args.pairs:
+        vintage_pairs(panel).to_csv(args.pairs, index = False)